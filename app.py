@@ -1,20 +1,37 @@
 # Replit Auth Blueprint - Flask app initialization
-from flask import Flask
-from flask_sqlalchemy import SQLAlchemy
+from flask import Flask, request
+from flask.sessions import SecureCookieSessionInterface
 from flask_cors import CORS
-from sqlalchemy.orm import DeclarativeBase
 import os
 from werkzeug.middleware.proxy_fix import ProxyFix
 import logging
 from flask_login import LoginManager
-from db_service import get_db, User as MongoUser
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
+from db_service import get_cached_user
+from metrics import install_log_request_ids
+# Configure logging (every record carries the request ID of the request being served)
+logging.basicConfig(level=logging.DEBUG,
+                    format='%(asctime)s %(levelname)s [%(request_id)s] %(name)s: %(message)s')
+install_log_request_ids()
+
+
+# Paths that use the login session. Elsewhere (static files, the app shell) an unchanged
+# session is not saved, so those responses go out without Set-Cookie / Vary: Cookie and
+# stay cacheable (Flask-Login reads the session after every request, which alone would
+# add Vary: Cookie)
+SESSION_PREFIXES = ('/api/', '/auth/', '/login/')
+
+
+class AppSessionInterface(SecureCookieSessionInterface):
+    def save_session(self, app, session, response):
+        if session.modified or request.path.startswith(SESSION_PREFIXES):
+            super().save_session(app, session, response)
 
 
 # Initialize Flask app
-app = Flask(__name__, static_folder='client/dist', static_url_path='')
+# The React build is served by routes.serve_react from static_assets' in-memory index
+app = Flask(__name__, static_folder=None)
 app.secret_key = os.environ.get("SESSION_SECRET", "super_secret_key_123")
+app.session_interface = AppSessionInterface()
 app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
 
 # CORS configuration
@@ -27,14 +44,7 @@ login_manager.login_message = "Vui lòng đăng nhập để truy cập trang n
 @login_manager.user_loader
 def load_user(user_id):
     """Tải user từ database dựa trên user_id."""
-    user_data = get_db().users.find_one({"_id": user_id})
-    if user_data:
-        return MongoUser(user_data)
-    return None
-
-try:
-    from db_service import get_db
-    get_db() # Thử kết nối
-    logging.info("MongoDB connection for user data successful.")
-except Exception as e:
-    logging.error(f"MongoDB connection failed: {e}")
\ No newline at end of file
+    return get_cached_user(user_id)
+
+# MongoDB is connected per process after fork (db_service.init_worker),
+# not at import time, so a preloading gunicorn master never owns a client.
\ No newline at end of file
@@ -0,0 +1,107 @@
+# Long-lived asyncio event loop shared by all request threads of a worker
+import asyncio
+import contextvars
+import logging
+import os
+import threading
+
+_END = object()
+
+
+class BackgroundLoop:
+    """Một event loop chạy suốt vòng đời worker trong một daemon thread.
+
+    Request threads (gunicorn gthread / Flask dev server) submit coroutines to
+    it and block on the result, so all upstream I/O of a worker is multiplexed
+    on one loop instead of creating and tearing down a loop per request. The
+    loop is recreated lazily if the process has forked since it was started.
+    """
+
+    def __init__(self):
+        self._loop = None
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def get_loop(self) -> asyncio.AbstractEventLoop:
+        if self._loop is not None and self._pid == os.getpid():
+            return self._loop
+        with self._lock:
+            if self._loop is None or self._pid != os.getpid():
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(
+                    target=self._loop.run_forever, name='async-runtime', daemon=True
+                )
+                self._thread.start()
+                self._pid = os.getpid()
+                logging.info(f'Background event loop started in process {self._pid}')
+        return self._loop
+
+    def run(self, coro, timeout: float = None):
+        """Run a coroutine on the background loop and wait for its result.
+
+        The caller's context variables (e.g. the request ID) are visible inside it.
+        """
+        future = asyncio.run_coroutine_threadsafe(
+            _in_context(coro, contextvars.copy_context()), self.get_loop()
+        )
+        try:
+            return future.result(timeout)
+        except BaseException:
+            # Timed out or the calling thread was interrupted: don't leave the work running
+            future.cancel()
+            raise
+
+    def iterate(self, agen, timeout: float = None):
+        """Consume an async generator from a sync thread, one item at a time.
+
+        Closing this generator (e.g. the WSGI server closing the response when the
+        client disconnects) closes the async generator on the loop as well.
+        """
+        try:
+            while True:
+                item = self.run(_anext(agen), timeout)
+                if item is _END:
+                    return
+                yield item
+        finally:
+            self.run(_aclose(agen), timeout)
+
+    def stop(self):
+        with self._lock:
+            if self._loop is not None and self._pid == os.getpid():
+                self._loop.call_soon_threadsafe(self._loop.stop)
+                self._thread.join(timeout=5)
+            self._loop = None
+            self._thread = None
+
+
+async def _in_context(coro, context):
+    # The task runs in its own copy of the loop thread's context; import the caller's values
+    for var, value in context.items():
+        var.set(value)
+    return await coro
+
+
+async def _anext(agen):
+    try:
+        return await agen.__anext__()
+    except StopAsyncIteration:
+        return _END
+
+
+async def _aclose(agen):
+    await agen.aclose()
+
+
+runtime = BackgroundLoop()
+
+
+def run_async(coro, timeout: float = None):
+    """Shortcut for runtime.run()."""
+    return runtime.run(coro, timeout)
+
+
+def iterate_async(agen, timeout: float = None):
+    """Shortcut for runtime.iterate()."""
+    return runtime.iterate(agen, timeout)
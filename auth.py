@@ -2,7 +2,7 @@ from flask import Blueprint, redirect, url_for, session
 from flask_dance.contrib.google import make_google_blueprint, google
 from flask_dance.contrib.github import make_github_blueprint, github
 from flask_login import login_user
-from db_service import find_user_by_email, save_user
+from db_service import save_user
 import os
 
 auth_bp = Blueprint("auth", __name__)
@@ -38,10 +38,8 @@ def google_login():
         
     user_info = resp.json()
 
-    user = find_user_by_email(user_info["email"])
-    
-    if not user:
-        user = save_user(user_info)
+    # Một round trip: tìm theo email hoặc tạo mới
+    user = save_user(user_info)
     
     login_user(user)
     next_url = session.pop("next_url", "/")
@@ -68,10 +66,8 @@ def github_login():
     if not email:
         return "Không thể lấy email từ tài khoản GitHub của bạn.", 400
 
-    user = find_user_by_email(email)
-    if not user:
-        user_info['email'] = email
-        user = save_user(user_info)
+    user_info['email'] = email
+    user = save_user(user_info)
 
     login_user(user)
     next_url = session.pop("next_url", "/")
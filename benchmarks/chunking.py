@@ -0,0 +1,207 @@
+# Compare the legacy character splitter with the structured chunker.
+#
+# For each splitter: chunk counts and sizes, embedding requests (sequential and
+# with the pipeline's batching), and a lexical retrieval hit rate: sentences
+# are sampled from the articles, queried with some words dropped, and a hit
+# means a top-k chunk (ranked by the fake bag-of-words embedding) contains the
+# whole sentence.
+#
+# Context: runs of --top-k consecutive chunks of a page (what retrieval
+# returns for a question about one section) go through the web app's
+# ContextBuilder; --min-context-saving makes the script fail when the
+# structured chunks no longer shrink.
+#
+#   python benchmarks/chunking.py                      # synthetic articles
+#   python benchmarks/chunking.py --html-dir pages/    # saved Wikipedia HTML
+#   python benchmarks/chunking.py --fetch 20           # download FOOTBALL_URLS
+#   python benchmarks/chunking.py --min-context-saving 0.01
+import argparse
+import glob
+import json
+import os
+import random
+import statistics
+import sys
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'data'))
+
+os.environ.setdefault('OPENAI_API_KEY', 'sk-offline-benchmark')
+os.environ.setdefault('ASTRA_DB_ENDPOINT', 'https://offline-benchmark.apps.astra.datastax.com')
+os.environ.setdefault('ASTRA_DB_APPLICATION_TOKEN', 'AstraCS:offline-benchmark')
+
+from fakes import fake_embedding  # noqa: E402
+
+
+def synthetic_article(index: int, sections: int = 8) -> str:
+    """Wikipedia-shaped HTML with distinct pseudo-words, so sentences are identifiable."""
+    rng = random.Random(index)
+    syllables = ['ba', 'lo', 'mi', 'ta', 'ne', 'ro', 'sa', 'vu', 'ki', 'de', 'ga', 'phu', 'thi', 'ngo']
+
+    def word():
+        return ''.join(rng.choice(syllables) for _ in range(rng.randint(1, 3)))
+
+    def sentence():
+        words = [word() for _ in range(rng.randint(8, 25))]
+        words[0] = words[0].capitalize()
+        return ' '.join(words) + '.'
+
+    body = []
+    for s in range(sections):
+        body.append(f'<h2><span class="mw-headline">Mục {s} {word()}</span>'
+                    f'<span class="mw-editsection">[sửa]</span></h2>')
+        for _ in range(rng.randint(1, 3)):
+            if rng.random() < 0.5:
+                body.append(f'<h3>Tiểu mục {word()}</h3>')
+            for _ in range(rng.randint(1, 4)):
+                sentences = ' '.join(sentence() for _ in range(rng.randint(2, 8)))
+                body.append(f'<p>{sentences}<sup>[{rng.randint(1, 99)}]</sup></p>')
+            if rng.random() < 0.3:
+                body.append('<ul>' + ''.join(f'<li>{sentence()}</li>' for _ in range(rng.randint(2, 6))) + '</ul>')
+    body.append('<h2>Tham khảo</h2><ol class="references">'
+                + ''.join(f'<li>Nguồn {i} {word()} {word()}, truy cập 2024.</li>' for i in range(20)) + '</ol>')
+    return (f'<html><body><h1 id="firstHeading">Bài {index}</h1>'
+            f'<div id="mw-content-text">{"".join(body)}</div></body></html>')
+
+
+def load_pages(args) -> list:
+    if args.html_dir:
+        pages = []
+        for path in sorted(glob.glob(os.path.join(args.html_dir, '*.htm*'))):
+            with open(path, 'rb') as f:
+                pages.append((path, f.read()))
+        return pages
+    if args.fetch:
+        from data_ingestion import FOOTBALL_URLS, FootballDataIngestion
+        ingestion = FootballDataIngestion()
+        pages = []
+        for url in FOOTBALL_URLS[:args.fetch]:
+            try:
+                pages.append((url, ingestion.fetch_page(url)))
+            except Exception as e:
+                print(f'skip {url}: {e}', file=sys.stderr)
+        return pages
+    return [(f'synthetic-{i}', synthetic_article(i).encode('utf-8')) for i in range(args.pages)]
+
+
+def embedding_requests(token_counts: list, batch_size: int, batch_tokens: int) -> int:
+    """Embedding requests the ingestion batcher would make for these chunk sizes."""
+    requests, in_batch, tokens_in_batch = 0, 0, 0
+    for tokens in token_counts:
+        if in_batch and (in_batch >= batch_size or tokens_in_batch + tokens > batch_tokens):
+            requests += 1
+            in_batch, tokens_in_batch = 0, 0
+        in_batch += 1
+        tokens_in_batch += tokens
+    return requests + (1 if in_batch else 0)
+
+
+def context_saving(chunks: list, top_k: int) -> dict:
+    """Raw vs built context tokens over windows of top_k consecutive chunks of one page."""
+    from context_builder import ContextBuilder
+    builder = ContextBuilder(max_tokens=10 ** 9)
+    by_source = {}
+    for source, text in chunks:
+        by_source.setdefault(source, []).append(text)
+    raw = built = 0
+    for source, texts in by_source.items():
+        for start in range(0, len(texts) - top_k + 1, top_k):
+            result = builder.build([{'text': t, 'source': source} for t in texts[start:start + top_k]])
+            raw += result.raw_tokens
+            built += result.tokens
+    return {
+        'context_raw_tokens': raw,
+        'context_built_tokens': built,
+        'context_saving': round(1 - built / raw, 4) if raw else 0.0,
+    }
+
+
+def evaluate(name: str, chunks: list, probes: list, count_tokens, args) -> dict:
+    texts = [text for _, text in chunks]
+    token_counts = [count_tokens(text) for text in texts]
+    matrix = np.asarray([fake_embedding(text, args.dimension) for text in texts], dtype=np.float32)
+    normalized = [' '.join(text.split()) for text in texts]
+
+    hits_at_1 = hits_at_k = 0
+    for query, sentence in probes:
+        scores = matrix @ np.asarray(fake_embedding(query, args.dimension), dtype=np.float32)
+        top = np.argsort(-scores)[:args.top_k]
+        found = [sentence in normalized[i] for i in top]
+        hits_at_1 += found[0]
+        hits_at_k += any(found)
+
+    ordered = sorted(token_counts)
+    return {
+        'splitter': name,
+        'chunks': len(texts),
+        'tokens_embedded': sum(token_counts),
+        'tokens_per_chunk_mean': round(statistics.fmean(ordered), 1) if ordered else 0,
+        'tokens_per_chunk_p95': ordered[int(0.95 * (len(ordered) - 1))] if ordered else 0,
+        'chunks_under_50_tokens': sum(1 for t in ordered if t < 50),
+        'embedding_requests_sequential': len(texts),
+        'embedding_requests_batched': embedding_requests(token_counts, args.batch_size, args.batch_tokens),
+        'hit@1': round(hits_at_1 / len(probes), 3) if probes else None,
+        f'hit@{args.top_k}': round(hits_at_k / len(probes), 3) if probes else None,
+        **context_saving(chunks, args.top_k),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the legacy splitter and the structured chunker')
+    parser.add_argument('--pages', type=int, default=30, help='Synthetic articles (without --html-dir/--fetch)')
+    parser.add_argument('--html-dir', help='Directory of saved article HTML files')
+    parser.add_argument('--fetch', type=int, default=0, help='Download the first N FOOTBALL_URLS')
+    parser.add_argument('--probes', type=int, default=300, help='Sampled sentences used as queries')
+    parser.add_argument('--drop', type=float, default=0.3, help='Fraction of words dropped from each query')
+    parser.add_argument('--top-k', type=int, default=3)
+    parser.add_argument('--dimension', type=int, default=256, help='Fake embedding dimension')
+    parser.add_argument('--batch-size', type=int, default=256)
+    parser.add_argument('--batch-tokens', type=int, default=200000)
+    parser.add_argument('--min-context-saving', type=float, default=None,
+                        help='Exit with an error if the context builder saves less than this on structured chunks')
+    args = parser.parse_args()
+
+    from chunker import StructuredChunker, split_sentences
+    from data_ingestion import FootballDataIngestion
+
+    ingestion = FootballDataIngestion()
+    structured = ingestion.chunker or StructuredChunker()
+    count_tokens = structured.count_tokens
+
+    legacy_chunks, structured_chunks, sentences = [], [], []
+    for source, html in load_pages(args):
+        content = ingestion.parse_content(html)
+        legacy_chunks += [(source, chunk) for chunk in ingestion.split_text(content)] if content else []
+        title, blocks = ingestion.parse_article(html)
+        structured_chunks += [(source, chunk) for chunk in structured.chunks(blocks, title)]
+        for tag, text in blocks:
+            if tag == 'p':
+                sentences += [s for s in split_sentences(text) if len(s.split()) >= 6]
+
+    rng = random.Random(0)
+    probes = []
+    for sentence in rng.sample(sentences, min(args.probes, len(sentences))):
+        words = sentence.split()
+        kept = [w for w in words if rng.random() >= args.drop] or words
+        probes.append((' '.join(kept), ' '.join(words)))
+
+    results = [
+        evaluate('legacy', legacy_chunks, probes, count_tokens, args),
+        evaluate('structured', structured_chunks, probes, count_tokens, args),
+    ]
+    print(json.dumps({
+        'pages': len({source for source, _ in legacy_chunks + structured_chunks}),
+        'probes': len(probes),
+        'results': results,
+    }, indent=2, ensure_ascii=False))
+    if args.min_context_saving is not None and results[1]['context_saving'] < args.min_context_saving:
+        print(f"FAIL: context builder saves {results[1]['context_saving']:.1%} on structured chunks, "
+              f"expected at least {args.min_context_saving:.1%}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+# Recall and search latency of reduced / int8 embeddings against the 1536-d baseline.
+#
+# Ground truth is the exact top-k with full 1536-d float32 vectors. Every
+# other configuration (fewer dimensions by truncation + re-normalization,
+# which is what `dimensions=` returns, optionally int8-quantized) is scored by
+# recall@k against it, with search latency over the whole matrix as the local
+# index does it, and the index size.
+#
+#   python benchmarks/embedding_dimensions.py --index-dir data/vector_index   # real vectors (1536-d snapshot)
+#   python benchmarks/embedding_dimensions.py --questions questions.txt ...   # real questions (calls OpenAI)
+#   python benchmarks/embedding_dimensions.py                                 # synthetic vectors
+#
+# Without --questions, held-out documents are used as queries. Synthetic
+# vectors only exercise the code and latency: their recall says nothing
+# about text-embedding-3.
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from embeddings import EMBEDDING_MODEL, NATIVE_DIMENSIONS, reduce_dimensions  # noqa: E402
+from vector_index import int8_scores, quantize_int8  # noqa: E402
+
+
+def load_snapshot(directory: str) -> np.ndarray:
+    with open(os.path.join(directory, 'CURRENT'), encoding='utf-8') as f:
+        path = os.path.join(directory, f.read().strip())
+    with open(os.path.join(path, 'manifest.json'), encoding='utf-8') as f:
+        manifest = json.load(f)
+    return np.fromfile(os.path.join(path, 'vectors.f32'), dtype=np.float32).reshape(
+        manifest['count'], manifest['dimension'])
+
+
+def synthetic_vectors(count: int, dimension: int, seed: int = 0) -> np.ndarray:
+    """Clustered vectors whose variance decays with the component index, like matryoshka embeddings."""
+    rng = np.random.default_rng(seed)
+    decay = (1 + np.arange(dimension, dtype=np.float32)) ** -0.5
+    centers = rng.standard_normal((max(count // 20, 1), dimension), dtype=np.float32) * decay
+    vectors = centers[rng.integers(0, len(centers), count)]
+    vectors += 0.6 * rng.standard_normal((count, dimension), dtype=np.float32) * decay
+    return reduce_dimensions(vectors, dimension)
+
+
+def embed_questions(path: str) -> np.ndarray:
+    from openai import OpenAI
+    with open(path, encoding='utf-8') as f:
+        questions = [line.strip() for line in f if line.strip()]
+    response = OpenAI().embeddings.create(model=EMBEDDING_MODEL, input=questions, encoding_format='float')
+    return np.asarray([d.embedding for d in sorted(response.data, key=lambda d: d.index)], dtype=np.float32)
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top])]
+
+
+def evaluate(corpus, queries, truth, dimensions: int, quantize: bool, k: int) -> dict:
+    vectors = reduce_dimensions(corpus, dimensions)
+    reduced_queries = reduce_dimensions(queries, dimensions)
+    scales = None
+    if quantize:
+        vectors, scales = quantize_int8(vectors)
+
+    latencies, recalls = [], []
+    for query, expected in zip(reduced_queries, truth):
+        started = time.perf_counter()
+        scores = vectors @ query if scales is None else int8_scores(vectors, scales, query)
+        found = top_k(scores, k)
+        latencies.append((time.perf_counter() - started) * 1000)
+        recalls.append(len(set(found.tolist()) & set(expected.tolist())) / k)
+
+    latencies.sort()
+    return {
+        'dimensions': dimensions,
+        'dtype': 'int8' if quantize else 'float32',
+        f'recall@{k}': round(statistics.fmean(recalls), 4),
+        'search_ms_p50': round(latencies[len(latencies) // 2], 3),
+        'search_ms_p95': round(latencies[int(0.95 * (len(latencies) - 1))], 3),
+        'index_mb': round((vectors.nbytes + (scales.nbytes if scales is not None else 0)) / 1e6, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Recall@k and latency of reduced/quantized embeddings')
+    parser.add_argument('--index-dir', help='Local vector index directory with a 1536-d snapshot')
+    parser.add_argument('--questions', help='Text file of questions, embedded with OpenAI at full size')
+    parser.add_argument('--count', type=int, default=50000, help='Synthetic corpus size')
+    parser.add_argument('--queries', type=int, default=200, help='Held-out documents used as queries')
+    parser.add_argument('--top-k', type=int, default=5)
+    parser.add_argument('--dimensions', type=int, nargs='*', default=[1536, 1024, 768, 512, 256])
+    args = parser.parse_args()
+
+    native = NATIVE_DIMENSIONS[EMBEDDING_MODEL]
+    corpus = load_snapshot(args.index_dir) if args.index_dir else synthetic_vectors(args.count, native)
+    if corpus.shape[1] != native:
+        sys.exit(f'The baseline needs {native}-d vectors, the snapshot has {corpus.shape[1]}')
+    if args.questions:
+        queries = embed_questions(args.questions)
+    else:
+        rng = np.random.default_rng(1)
+        held_out = rng.choice(len(corpus), size=min(args.queries, len(corpus) // 10), replace=False)
+        queries = corpus[held_out]
+        corpus = np.delete(corpus, held_out, axis=0)
+    truth = [top_k(corpus @ query, args.top_k) for query in reduce_dimensions(queries, native)]
+
+    results = [
+        evaluate(corpus, queries, truth, dimensions, quantize, args.top_k)
+        for dimensions in args.dimensions
+        for quantize in (False, True)
+    ]
+    print(json.dumps({
+        'corpus': 'synthetic' if not args.index_dir else args.index_dir,
+        'documents': len(corpus),
+        'queries': len(queries),
+        'results': results,
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,472 @@
+# Local stand-ins for OpenAI, the Astra Data API and MongoDB used by the benchmarks.
+#
+# They implement only the calls this repo makes, with configurable latency, so
+# /api/chat and ingestion can be load-tested without paid services.
+import asyncio
+import functools
+import hashlib
+import itertools
+import random
+import re
+import threading
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+import numpy as np
+
+
+class Latency:
+    """Latency distribution parsed from a spec string (values in milliseconds).
+
+    "0" | "fixed:120" | "uniform:50,150" | "lognormal:800,0.4" (median, sigma)
+    """
+
+    def __init__(self, spec: str = '0'):
+        self.spec = spec
+        kind, _, params = spec.partition(':')
+        if not params:
+            kind, params = 'fixed', kind
+        values = [float(v) for v in params.split(',')]
+        self.kind = kind
+        self.values = values
+        self._random = random.Random(spec)
+        self._lock = threading.Lock()
+
+    def sample(self) -> float:
+        """One latency sample in seconds."""
+        with self._lock:
+            if self.kind == 'fixed':
+                ms = self.values[0]
+            elif self.kind == 'uniform':
+                ms = self._random.uniform(*self.values)
+            elif self.kind == 'lognormal':
+                median, sigma = self.values
+                ms = self._random.lognormvariate(np.log(median), sigma)
+            else:
+                raise ValueError(f'Unknown latency distribution: {self.spec}')
+        return max(ms, 0) / 1000
+
+
+@functools.lru_cache(maxsize=65536)
+def _word_vector(word: str, dimension: int):
+    seed = int.from_bytes(hashlib.blake2b(word.encode('utf-8'), digest_size=8).digest(), 'little')
+    return np.random.default_rng(seed).standard_normal(dimension, dtype=np.float32)
+
+
+def fake_embedding(text: str, dimension: int = 1536) -> list:
+    """Deterministic unit vector for a text; texts sharing words get similar vectors."""
+    vector = np.zeros(dimension, dtype=np.float32)
+    for word in re.findall(r'\w+', text.casefold()):
+        vector += _word_vector(word, dimension)
+    norm = np.linalg.norm(vector)
+    if not norm:
+        vector[0], norm = 1.0, 1.0
+    return (vector / norm).tolist()
+
+
+def _usage(prompt_tokens: int, completion_tokens: int = 0):
+    return SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                           total_tokens=prompt_tokens + completion_tokens)
+
+
+def _tokens(text: str) -> int:
+    return len(text) // 3 + 1
+
+
+# --- OpenAI -----------------------------------------------------------------
+
+class _EmbeddingsBase:
+    def __init__(self, latency: Latency, dimension: int):
+        self.latency = latency
+        self.dimension = dimension
+        self.calls = 0
+        self.inputs = 0
+
+    def _response(self, input, dimensions=None):
+        texts = [input] if isinstance(input, str) else list(input)
+        self.calls += 1
+        self.inputs += len(texts)
+        dimension = dimensions or self.dimension
+        return SimpleNamespace(
+            data=[SimpleNamespace(index=i, embedding=fake_embedding(t, dimension)) for i, t in enumerate(texts)],
+            usage=_usage(sum(_tokens(t) for t in texts)),
+        )
+
+
+class FakeEmbeddings(_EmbeddingsBase):
+    def create(self, model=None, input=None, encoding_format=None, dimensions=None, **kwargs):
+        time.sleep(self.latency.sample())
+        return self._response(input, dimensions)
+
+
+class FakeAsyncEmbeddings(_EmbeddingsBase):
+    async def create(self, model=None, input=None, encoding_format=None, dimensions=None, **kwargs):
+        await asyncio.sleep(self.latency.sample())
+        return self._response(input, dimensions)
+
+
+def _reply_for(messages) -> str:
+    question = messages[-1]['content']
+    return f'Đây là câu trả lời mô phỏng cho câu hỏi: {question} ' + 'bóng đá ' * 40
+
+
+class FakeAsyncStream:
+    """Async iterator of chat.completion.chunk-like objects."""
+
+    def __init__(self, text: str, first_token_delay: float, token_delay: float, prompt_tokens: int):
+        self._words = text.split(' ')
+        self._first_token_delay = first_token_delay
+        self._token_delay = token_delay
+        self._prompt_tokens = prompt_tokens
+        self.closed = False
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        await asyncio.sleep(self._first_token_delay)
+        for i, word in enumerate(self._words):
+            if self.closed:
+                return
+            if i:
+                await asyncio.sleep(self._token_delay)
+            delta = SimpleNamespace(content=word if i == 0 else ' ' + word)
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=delta)], usage=None)
+        yield SimpleNamespace(choices=[], usage=_usage(self._prompt_tokens, len(self._words)))
+
+    async def close(self):
+        self.closed = True
+
+
+class _CompletionsBase:
+    def __init__(self, latency: Latency, token_latency: Latency):
+        self.latency = latency
+        self.token_latency = token_latency
+        self.calls = 0
+
+    def _response(self, messages):
+        self.calls += 1
+        reply = _reply_for(messages)
+        prompt_tokens = sum(_tokens(m['content']) for m in messages)
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=reply))],
+            usage=_usage(prompt_tokens, _tokens(reply)),
+        )
+
+
+class FakeCompletions(_CompletionsBase):
+    def create(self, model=None, messages=None, stream=False, **kwargs):
+        time.sleep(self.latency.sample())
+        return self._response(messages)
+
+
+class FakeAsyncCompletions(_CompletionsBase):
+    async def create(self, model=None, messages=None, stream=False, **kwargs):
+        if stream:
+            self.calls += 1
+            return FakeAsyncStream(_reply_for(messages), self.latency.sample(),
+                                   self.token_latency.sample(),
+                                   sum(_tokens(m['content']) for m in messages))
+        await asyncio.sleep(self.latency.sample())
+        return self._response(messages)
+
+
+class FakeOpenAI:
+    """Sync client (ingestion): embeddings and chat.completions."""
+
+    def __init__(self, embedding_latency='0', chat_latency='0', dimension=1536):
+        self.embeddings = FakeEmbeddings(Latency(embedding_latency), dimension)
+        self.chat = SimpleNamespace(completions=FakeCompletions(Latency(chat_latency), Latency('0')))
+
+
+class FakeAsyncOpenAI:
+    """Async client (web path). `chat_latency` is the time to the first token."""
+
+    def __init__(self, embedding_latency='0', chat_latency='0', token_latency='0', dimension=1536):
+        self.embeddings = FakeAsyncEmbeddings(Latency(embedding_latency), dimension)
+        self.chat = SimpleNamespace(completions=FakeAsyncCompletions(Latency(chat_latency), Latency(token_latency)))
+
+
+# --- Astra Data API ---------------------------------------------------------
+
+class FakeAstraCollection:
+    """In-memory vector collection with Data API style find/insert calls (sync)."""
+
+    def __init__(self, name='fake', latency='0'):
+        self.name = name
+        self.latency = Latency(latency)
+        self.documents = {}
+        self._ids = itertools.count()
+        self._matrix = None
+        self._order = []
+        self._lock = threading.Lock()
+        self.find_calls = 0
+        self.insert_calls = 0
+
+    def _index(self):
+        if self._matrix is None:
+            self._order = [d for d in self.documents.values() if '$vector' in d]
+            self._matrix = (np.asarray([d['$vector'] for d in self._order], dtype=np.float32)
+                            if self._order else None)
+        return self._matrix
+
+    def _find(self, filter=None, sort=None, limit=None, projection=None, **kwargs):
+        self.find_calls += 1
+        with self._lock:
+            if sort and '$vector' in sort:
+                matrix = self._index()
+                if matrix is None:
+                    return []
+                query = np.asarray(sort['$vector'], dtype=np.float32)
+                scores = matrix @ (query / (np.linalg.norm(query) or 1.0))
+                top = np.argsort(-scores)[:limit or len(scores)]
+                docs = [self._order[i] for i in top]
+            else:
+                docs = list(self.documents.values())[:limit] if limit else list(self.documents.values())
+        return [dict(d) for d in docs]
+
+    def _insert(self, documents):
+        with self._lock:
+            for doc in documents:
+                doc = dict(doc)
+                doc.setdefault('_id', str(next(self._ids)))
+                if doc['_id'] in self.documents:
+                    raise ValueError(f"DOCUMENT_ALREADY_EXISTS: {doc['_id']}")
+                self.documents[doc['_id']] = doc
+            self._matrix = None
+        self.insert_calls += 1
+
+    def find(self, filter=None, **kwargs):
+        time.sleep(self.latency.sample())
+        return iter(self._find(filter, **kwargs))
+
+    def insert_many(self, documents, **kwargs):
+        time.sleep(self.latency.sample())
+        self._insert(documents)
+
+    def insert_one(self, document, **kwargs):
+        self.insert_many([document])
+
+    def replace_one(self, filter, replacement, upsert=False, **kwargs):
+        with self._lock:
+            self.documents[filter['_id']] = dict(replacement)
+            self._matrix = None
+
+    def delete_many(self, filter, **kwargs):
+        with self._lock:
+            for _id in filter.get('_id', {}).get('$in', []):
+                self.documents.pop(_id, None)
+            self._matrix = None
+
+    def count_documents(self, filter=None, upper_bound=None, **kwargs):
+        return len(self.documents)
+
+    def estimated_document_count(self, **kwargs):
+        return len(self.documents)
+
+
+class FakeAsyncAstraCollection:
+    """Async view (AsyncCollection-like) over a FakeAstraCollection."""
+
+    def __init__(self, collection: FakeAstraCollection):
+        self.sync = collection
+        self.name = collection.name
+
+    def find(self, filter=None, **kwargs):
+        # The Data API cursor only does I/O when iterated
+        async def fetch():
+            await asyncio.sleep(self.sync.latency.sample())
+            return self.sync._find(filter, **kwargs)
+        return _LazyAsyncCursor(fetch)
+
+    async def insert_many(self, documents, **kwargs):
+        await asyncio.sleep(self.sync.latency.sample())
+        self.sync._insert(documents)
+
+
+class _LazyAsyncCursor:
+    def __init__(self, fetch):
+        self._fetch = fetch
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for doc in await self._fetch():
+            yield doc
+
+    async def to_list(self):
+        return await self._fetch()
+
+
+class FakeAstraDatabase:
+    def __init__(self, latency='0'):
+        self.latency = latency
+        self.collections = {}
+
+    def get_collection(self, name, **kwargs):
+        if name not in self.collections:
+            self.collections[name] = FakeAstraCollection(name, self.latency)
+        return self.collections[name]
+
+    def create_collection(self, name, **kwargs):
+        return self.get_collection(name)
+
+    def list_collection_names(self, **kwargs):
+        return list(self.collections)
+
+    def list_collections(self, **kwargs):
+        return [{'name': name} for name in self.collections]
+
+    def drop_collection(self, name, **kwargs):
+        self.collections.pop(name, None)
+
+
+# --- MongoDB ----------------------------------------------------------------
+
+def _matches(doc: dict, query: dict) -> bool:
+    for key, condition in query.items():
+        if key == '$or':
+            if not any(_matches(doc, sub) for sub in condition):
+                return False
+            continue
+        value = doc.get(key)
+        if isinstance(condition, dict) and condition and all(k.startswith('$') for k in condition):
+            for op, operand in condition.items():
+                if op == '$lt' and not (value is not None and value < operand):
+                    return False
+                if op == '$gt' and not (value is not None and value > operand):
+                    return False
+                if op == '$in' and value not in operand:
+                    return False
+                if op == '$type' and operand == 'string' and not isinstance(value, str):
+                    return False
+        elif value != condition:
+            return False
+    return True
+
+
+def _project(doc: dict, projection) -> dict:
+    if not projection:
+        return dict(doc)
+    return {k: v for k, v in doc.items() if k == '_id' or projection.get(k)}
+
+
+class FakeMongoCursor:
+    def __init__(self, docs, projection):
+        self._docs = docs
+        self._projection = projection
+        self._limit = 0
+
+    def sort(self, key, direction=None):
+        keys = key if isinstance(key, list) else [(key, direction)]
+        for field, order in reversed(keys):
+            self._docs.sort(key=lambda d: d.get(field), reverse=order == -1)
+        return self
+
+    def limit(self, n):
+        self._limit = n
+        return self
+
+    def __iter__(self):
+        docs = self._docs[:self._limit] if self._limit else self._docs
+        return (_project(d, self._projection) for d in docs)
+
+
+class FakeMongoCollection:
+    def __init__(self, latency: Latency):
+        self.latency = latency
+        self.documents = []
+        self._lock = threading.Lock()
+
+    def _wait(self):
+        time.sleep(self.latency.sample())
+
+    def find(self, query=None, projection=None, batch_size=None, **kwargs):
+        self._wait()
+        with self._lock:
+            docs = [d for d in self.documents if _matches(d, query or {})]
+        return FakeMongoCursor(docs, projection)
+
+    def find_one(self, query=None, projection=None, **kwargs):
+        self._wait()
+        with self._lock:
+            for d in self.documents:
+                if _matches(d, query or {}):
+                    return _project(d, projection)
+        return None
+
+    def insert_one(self, document, **kwargs):
+        self.insert_many([document])
+
+    def insert_many(self, documents, ordered=True, **kwargs):
+        self._wait()
+        from bson import ObjectId
+        with self._lock:
+            for doc in documents:
+                doc.setdefault('_id', ObjectId())
+                self.documents.append(dict(doc))
+
+    def find_one_and_update(self, query, update, projection=None, upsert=False, **kwargs):
+        self._wait()
+        with self._lock:
+            for d in self.documents:
+                if _matches(d, query):
+                    d.update(update.get('$set', {}))
+                    for field, amount in update.get('$inc', {}).items():
+                        d[field] = d.get(field, 0) + amount
+                    return _project(d, projection)
+            if not upsert:
+                return None
+            doc = {k: v for k, v in query.items() if not isinstance(v, dict)}
+            doc.update(update.get('$setOnInsert', {}))
+            doc.update(update.get('$set', {}))
+            doc.update(update.get('$inc', {}))
+            self.documents.append(doc)
+            return _project(doc, projection)
+
+    def update_one(self, query, update, upsert=False, **kwargs):
+        self.find_one_and_update(query, update, upsert=upsert)
+
+    def delete_many(self, query, **kwargs):
+        self._wait()
+        with self._lock:
+            self.documents = [d for d in self.documents if not _matches(d, query)]
+
+    def create_index(self, keys, **kwargs):
+        return kwargs.get('name', 'index')
+
+    def count_documents(self, query=None, **kwargs):
+        with self._lock:
+            return sum(1 for d in self.documents if _matches(d, query or {}))
+
+
+class FakeMongoDatabase:
+    """In-process stand-in for the pymongo Database used by db_service."""
+
+    def __init__(self, latency='0'):
+        self._latency = Latency(latency)
+        self._collections = {}
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return self[name]
+
+    def __getitem__(self, name):
+        if name not in self._collections:
+            self._collections[name] = FakeMongoCollection(self._latency)
+        return self._collections[name]
+
+    def command(self, name, *args, **kwargs):
+        return {'ok': 1.0}
+
+
+def seed_users(db: FakeMongoDatabase, count: int) -> list:
+    """Create `count` users and return their ids."""
+    ids = [f'bench-user-{i}' for i in range(count)]
+    for user_id in ids:
+        db.users.insert_one({'_id': user_id, 'email': f'{user_id}@example.com',
+                             'first_name': 'Bench', 'created_at': datetime.now()})
+    return ids
@@ -0,0 +1,157 @@
+# Compare the HTML extraction backends and the parse process pool.
+#
+# For each backend: milliseconds per page for the extraction the ingestion
+# uses (structured blocks and legacy text), and how many pages extract
+# differently from BeautifulSoup's html.parser (should be 0 for well-formed
+# pages). Malformed snippets the backends parse differently are listed with
+# each backend's output (see html_extract). Then pages/s
+# of the structured extraction through a process pool of 1, 2, 4 and
+# cpu_count processes.
+#
+#   python benchmarks/html_parsing.py                          # synthetic articles
+#   python benchmarks/html_parsing.py --html-dir pages/        # saved Wikipedia HTML
+#   python benchmarks/html_parsing.py --fetch 50 --save-corpus pages/
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import unquote
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'data'))
+
+os.environ.setdefault('OPENAI_API_KEY', 'sk-offline-benchmark')
+os.environ.setdefault('ASTRA_DB_ENDPOINT', 'https://offline-benchmark.apps.astra.datastax.com')
+os.environ.setdefault('ASTRA_DB_APPLICATION_TOKEN', 'AstraCS:offline-benchmark')
+
+from chunking import load_pages, synthetic_article  # noqa: E402
+from html_extract import HAVE_LXML, extract_article, extract_text  # noqa: E402
+
+
+def wikipedia_page(index: int) -> bytes:
+    """A synthetic article wrapped in the page chrome, infobox and navboxes of a real one."""
+    rng = random.Random(index)
+    article = synthetic_article(index)
+    head, _, rest = article.partition('<div id="mw-content-text">')
+    infobox = ('<table class="infobox"><tr><th>Thành lập</th><td>1902</td></tr>'
+               + ''.join(f'<tr><th>Mục {i}</th><td>Giá trị&nbsp;{i}</td></tr>' for i in range(25)) + '</table>')
+    hatnote = '<div role="note" class="hatnote">Bài này nói về câu lạc bộ. Xem thêm <a href="#">trang khác</a>.</div>'
+    navbox = ('<div class="navbox"><table><tr><td>'
+              + ' · '.join(f'<a href="/wiki/X{i}">Đội {i}</a>' for i in range(60)) + '</td></tr></table></div>')
+    chrome = ('<head><title>Bài</title><style>.a{color:red}</style><script>var x = "<p>không</p>";</script></head>'
+              + '<div id="mw-navigation"><ul>' + ''.join(f'<li><a href="#">Liên kết {i}</a></li>' for i in range(80))
+              + '</ul></div>')
+    body = rest.replace('</div></body></html>', '')
+    body = body.replace('<h2>', f'<!-- section {rng.randint(0, 9)} --><h2>', 3)
+    html = (head.replace('<html><body>', f'<!DOCTYPE html><html lang="vi">{chrome}<body>')
+            + f'<div id="mw-content-text"><div class="mw-parser-output">{hatnote}{infobox}{body}{navbox}'
+            + '<dl><dd>Ghi chú &amp; chú thích <i>nghiêng</i></dd></dl>'
+            + '<p class="mw-empty-elt"></p></div></div><div id="footer">© Wikipedia</div></body></html>')
+    return html.encode('utf-8')
+
+
+# Malformed nesting that libxml2 and html.parser repair differently
+MALFORMED = {
+    'div_in_p': '<p>a<div>b</div>c</p>',
+    'unclosed_p_and_table': '<p>one<p>two<table><tr><td>x</td></tr></table>three',
+    'unclosed_li': '<ul><li>one<li>two</ul>',
+    'stray_end_tag': '<p>one</b> two</p>',
+}
+
+
+def malformed_outputs(backends: list) -> dict:
+    results = {}
+    for name, snippet in MALFORMED.items():
+        html = f'<html><body><div id="mw-content-text">{snippet}</div></body></html>'
+        outputs = {parser: {'article': [f'{tag}: {text}' for tag, text in extract_article(html, parser)[1]],
+                           'text': extract_text(html, parser)}
+                   for parser in backends}
+        results[name] = {'html': snippet, 'same': len({json.dumps(o) for o in outputs.values()}) == 1, **outputs}
+    return results
+
+
+def time_backend(parser: str, pages: list, repeat: int) -> dict:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for _, html in pages:
+            extract_article(html, parser)
+    article_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for _, html in pages:
+            extract_text(html, parser)
+    text_seconds = time.perf_counter() - started
+    runs = max(len(pages) * repeat, 1)
+    return {
+        'parser': parser,
+        'article_ms_per_page': round(1000 * article_seconds / runs, 2),
+        'text_ms_per_page': round(1000 * text_seconds / runs, 2),
+    }
+
+
+def mismatches(parser: str, pages: list) -> list:
+    different = []
+    for source, html in pages:
+        if (extract_article(html, parser) != extract_article(html, 'html.parser')
+                or extract_text(html, parser) != extract_text(html, 'html.parser')):
+            different.append(source)
+    return different
+
+
+def pool_throughput(parser: str, pages: list, processes: int) -> dict:
+    htmls = [html for _, html in pages]
+    with ProcessPoolExecutor(processes, mp_context=multiprocessing.get_context('spawn')) as pool:
+        # Start the workers (interpreter start-up and imports) before timing
+        list(pool.map(extract_article, htmls[:processes], [parser] * processes))
+        started = time.perf_counter()
+        list(pool.map(extract_article, htmls, [parser] * len(htmls)))
+        elapsed = time.perf_counter() - started
+    return {'parser': parser, 'processes': processes, 'pages_per_second': round(len(htmls) / elapsed, 1)}
+
+
+def save_corpus(pages: list, directory: str):
+    os.makedirs(directory, exist_ok=True)
+    for source, html in pages:
+        name = unquote(source.rstrip('/').rsplit('/', 1)[-1]).replace(os.sep, '_') or 'page'
+        with open(os.path.join(directory, f'{name}.html'), 'wb') as f:
+            f.write(html)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark HTML extraction backends and the parse process pool')
+    parser.add_argument('--pages', type=int, default=60, help='Synthetic articles (without --html-dir/--fetch)')
+    parser.add_argument('--html-dir', help='Directory of saved article HTML files')
+    parser.add_argument('--fetch', type=int, default=0, help='Download the first N FOOTBALL_URLS')
+    parser.add_argument('--save-corpus', help='Write the pages to this directory (for later --html-dir runs)')
+    parser.add_argument('--repeat', type=int, default=3, help='Passes over the pages per backend')
+    parser.add_argument('--processes', type=int, nargs='*', help='Pool sizes (default: 1 2 4 cpu_count)')
+    args = parser.parse_args()
+
+    if args.html_dir or args.fetch:
+        pages = load_pages(args)
+    else:
+        pages = [(f'synthetic-{i}', wikipedia_page(i)) for i in range(args.pages)]
+    if args.save_corpus:
+        save_corpus(pages, args.save_corpus)
+
+    backends = ['html.parser'] + (['lxml'] if HAVE_LXML else [])
+    fastest = backends[-1]
+    sizes = sorted(set(args.processes or [1, 2, 4, os.cpu_count() or 1]))
+    print(json.dumps({
+        'pages': len(pages),
+        'megabytes': round(sum(len(html) for _, html in pages) / 1e6, 1),
+        'cpu_count': os.cpu_count(),
+        'backends': [time_backend(name, pages, args.repeat) for name in backends],
+        'different_from_html.parser': {name: mismatches(name, pages) for name in backends[1:]},
+        'malformed': malformed_outputs(backends),
+        'process_pool': [pool_throughput(fastest, pages, n) for n in sizes],
+    }, indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,295 @@
+# Offline load test for the web app and the ingestion pipeline.
+#
+# OpenAI, Astra and MongoDB are replaced by the in-process fakes from
+# benchmarks/fakes.py; everything else is the real code path (main.app,
+# ChatService, db_service, FootballDataIngestion).
+#
+#   python benchmarks/loadtest.py web --concurrency 50 --duration 30 \
+#       --chat-latency lognormal:1500,0.4 --embedding-latency uniform:80,200
+#   python benchmarks/loadtest.py ingestion --pages 200 --embedding-latency fixed:300
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'data'))
+
+# Clients are constructed before the fakes are swapped in; they never connect
+os.environ.setdefault('OPENAI_API_KEY', 'sk-offline-benchmark')
+os.environ.setdefault('ASTRA_DB_ENDPOINT', 'https://offline-benchmark.apps.astra.datastax.com')
+os.environ.setdefault('ASTRA_DB_APPLICATION_TOKEN', 'AstraCS:offline-benchmark')
+os.environ.setdefault('ASTRA_DB_COLLECTION', 'benchmark')
+os.environ.setdefault('MONGODB_URI', 'mongodb://offline-benchmark')
+# A few simulated users send every request; per-user limits would turn the run into 429s
+os.environ.setdefault('CHAT_USER_RATE_PER_MINUTE', '0')
+
+from fakes import (  # noqa: E402
+    FakeAsyncOpenAI, FakeOpenAI, FakeAstraDatabase, FakeAsyncAstraCollection, FakeMongoDatabase,
+    Latency, fake_embedding, seed_users,
+)
+
+QUESTIONS = [
+    'Messi bao nhiêu quả bóng vàng?',
+    'Ai vô địch World Cup 2022?',
+    'Cristiano Ronaldo ghi bao nhiêu bàn cho Real Madrid?',
+    'Park Hang-seo dẫn dắt đội tuyển Việt Nam từ năm nào?',
+    'Tiki-taka là gì?',
+    'Câu lạc bộ nào vô địch Champions League nhiều nhất?',
+    'Luật việt vị được áp dụng như thế nào?',
+    'Ai là thủ môn xuất sắc nhất lịch sử?',
+]
+
+
+def percentile(sorted_values: list, q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(int(round(q / 100 * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def summarize(samples: dict, elapsed: float) -> dict:
+    report = {}
+    for endpoint, rows in sorted(samples.items()):
+        latencies = sorted(latency for latency, _ in rows)
+        errors = sum(1 for _, ok in rows if not ok)
+        report[endpoint] = {
+            'requests': len(rows),
+            'throughput_rps': round(len(rows) / elapsed, 2),
+            'error_rate': round(errors / len(rows), 4) if rows else 0.0,
+            'p50_ms': round(percentile(latencies, 50) * 1000, 1),
+            'p95_ms': round(percentile(latencies, 95) * 1000, 1),
+            'p99_ms': round(percentile(latencies, 99) * 1000, 1),
+            'mean_ms': round(statistics.fmean(latencies) * 1000, 1) if latencies else 0.0,
+        }
+    return report
+
+
+def seed_corpus(collection, chunks: int):
+    """Fill the fake vector collection with synthetic chunks about the test questions."""
+    rng = random.Random(0)
+    words = ' '.join(QUESTIONS).split()
+    documents = []
+    for i in range(chunks):
+        text = ' '.join(rng.choice(words) for _ in range(60))
+        documents.append({'_id': f'chunk-{i}', 'text': text, 'source': f'https://example.org/{i % 50}',
+                          '$vector': fake_embedding(text)})
+    collection.insert_many(documents)
+
+
+def install_web_fakes(args):
+    import chat_service
+    import db_service
+
+    openai_client = FakeAsyncOpenAI(args.embedding_latency, args.chat_latency, args.token_latency)
+    astra = FakeAstraDatabase(args.astra_latency)
+    collection = astra.get_collection(os.environ['ASTRA_DB_COLLECTION'])
+    seed_corpus(collection, args.corpus_chunks)
+
+    service = chat_service.ChatService()
+    service.openai_client = openai_client
+    service.db = astra
+    service.collection = FakeAsyncAstraCollection(collection)
+    chat_service._chat_service = service
+
+    mongo_db = FakeMongoDatabase(args.mongo_latency)
+    db_service.mongo._db = mongo_db
+    db_service.mongo._pid = os.getpid()
+    return openai_client, collection, mongo_db
+
+
+def run_web(args):
+    openai_client, collection, mongo_db = install_web_fakes(args)
+    from main import app
+
+    user_ids = seed_users(mongo_db, args.users)
+    mix = []
+    for part in args.mix.split(','):
+        endpoint, _, weight = part.partition(':')
+        mix += [endpoint] * int(weight or 1)
+    questions = QUESTIONS[:args.unique_questions] if args.unique_questions else QUESTIONS
+    if args.unique_questions > len(QUESTIONS):
+        questions = [f'{QUESTIONS[i % len(QUESTIONS)]} (#{i})' for i in range(args.unique_questions)]
+
+    samples = defaultdict(list)
+    samples_lock = threading.Lock()
+    deadline = time.perf_counter() + args.duration
+    remaining = [args.requests] if args.requests else None
+    counter_lock = threading.Lock()
+
+    def next_request_allowed():
+        if remaining is None:
+            return time.perf_counter() < deadline
+        with counter_lock:
+            if remaining[0] <= 0:
+                return False
+            remaining[0] -= 1
+            return True
+
+    def worker(worker_id: int):
+        rng = random.Random(worker_id)
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['_user_id'] = user_ids[worker_id % len(user_ids)]
+            session['_fresh'] = True
+        while next_request_allowed():
+            endpoint = rng.choice(mix)
+            started = time.perf_counter()
+            try:
+                if endpoint == 'chat':
+                    response = client.post('/api/chat', json={'message': rng.choice(questions)})
+                elif endpoint == 'stream':
+                    response = client.post('/api/chat/stream', json={'message': rng.choice(questions)})
+                    response.get_data()  # drain the SSE stream
+                elif endpoint == 'batch':
+                    batch = [rng.choice(questions) for _ in range(args.batch_size)]
+                    response = client.post('/api/chat/batch', json={'messages': batch})
+                elif endpoint == 'history':
+                    response = client.get('/api/chat/history?limit=20')
+                else:
+                    raise ValueError(f'Unknown endpoint in mix: {endpoint}')
+                ok = response.status_code < 400
+            except Exception:
+                ok = False
+            with samples_lock:
+                samples[endpoint].append((time.perf_counter() - started, ok))
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(worker, range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+
+    import chat_service
+    report = {
+        'scenario': 'web',
+        'concurrency': args.concurrency,
+        'elapsed_s': round(elapsed, 2),
+        'endpoints': summarize(samples, elapsed),
+        'upstream_calls': {
+            'embeddings': openai_client.embeddings.calls,
+            'chat_completions': openai_client.chat.completions.calls,
+            'vector_find': collection.find_calls,
+        },
+        'caches': chat_service.get_chat_service().cache_stats(),
+    }
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+class FakeHttpSession:
+    """Serves synthetic Wikipedia-like article HTML with a latency distribution."""
+
+    def __init__(self, latency: str, paragraphs: int):
+        self.latency = Latency(latency)
+        self.paragraphs = paragraphs
+        self.headers = {}
+        self.requests = 0
+
+    def get(self, url, timeout=None, headers=None, **kwargs):
+        from types import SimpleNamespace
+        time.sleep(self.latency.sample())
+        self.requests += 1
+        rng = random.Random(url)
+        words = ' '.join(QUESTIONS).split()
+        body = ''.join(
+            f"<h2>Mục {i}</h2><p>{' '.join(rng.choice(words) for _ in range(80))}.</p>"
+            for i in range(self.paragraphs)
+        )
+        html = f"<html><body><div id='mw-content-text'>{body}</div></body></html>"
+        etag = f'"{zlib.crc32(html.encode("utf-8")):08x}"'
+        if (headers or {}).get('If-None-Match') == etag:
+            response = SimpleNamespace(content=b'', status_code=304, headers={'ETag': etag})
+        else:
+            response = SimpleNamespace(content=html.encode('utf-8'), status_code=200, headers={'ETag': etag})
+        response.raise_for_status = lambda: None
+        return response
+
+    def post(self, url, **kwargs):
+        raise RuntimeError('No network in the offline benchmark')
+
+
+def run_ingestion(args):
+    import data_ingestion
+    from page_store import PageStore
+
+    os.environ.pop('CACHE_INVALIDATE_URL', None)
+    manifest_dir = tempfile.mkdtemp(prefix='ingest-bench-')
+    ingestion = data_ingestion.FootballDataIngestion()
+    ingestion.manifest_path = os.path.join(manifest_dir, 'manifest.json')
+    ingestion.openai_client = FakeOpenAI(args.embedding_latency)
+    ingestion.db = FakeAstraDatabase(args.astra_latency)
+    ingestion.http_session = FakeHttpSession(args.fetch_latency, args.paragraphs)
+    # A persistent --page-store lets a second run revalidate (304) or run --offline
+    ingestion.page_store = PageStore(args.page_store or os.path.join(manifest_dir, 'pages'))
+    ingestion.offline = args.offline
+
+    urls = [f'https://vi.wikipedia.org/wiki/Benchmark_{i}' for i in range(args.pages)]
+    started = time.perf_counter()
+    asyncio.run(ingestion.ingest_data(urls, batched=not args.sequential))
+    elapsed = time.perf_counter() - started
+
+    collection = ingestion.db.get_collection(ingestion.collection_name)
+    chunks = len(collection.documents)
+    print(json.dumps({
+        'scenario': 'ingestion',
+        'mode': 'sequential' if args.sequential else 'pipeline',
+        'pages': args.pages,
+        'chunks': chunks,
+        'elapsed_s': round(elapsed, 2),
+        'chunks_per_s': round(chunks / elapsed, 1),
+        'pages_per_s': round(args.pages / elapsed, 2),
+        'http_requests': ingestion.http_session.requests,
+        'pages_not_modified': ingestion.page_store.not_modified,
+        'embedding_requests': ingestion.openai_client.embeddings.calls,
+        'insert_requests': collection.insert_calls,
+    }, indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline load test with local fakes')
+    sub = parser.add_subparsers(dest='scenario', required=True)
+
+    web = sub.add_parser('web', help='Drive main.app at a target concurrency')
+    web.add_argument('--concurrency', type=int, default=20)
+    web.add_argument('--duration', type=float, default=10, help='Seconds (ignored with --requests)')
+    web.add_argument('--requests', type=int, default=0, help='Total requests instead of a duration')
+    web.add_argument('--mix', default='chat:7,history:3', help='endpoint:weight list (chat, stream, batch, history)')
+    web.add_argument('--batch-size', type=int, default=10, help='Questions per /api/chat/batch request')
+    web.add_argument('--users', type=int, default=50)
+    web.add_argument('--unique-questions', type=int, default=0,
+                     help='Number of distinct questions (0 = the built-in 8, repeated)')
+    web.add_argument('--corpus-chunks', type=int, default=2000)
+    web.add_argument('--embedding-latency', default='uniform:80,200')
+    web.add_argument('--chat-latency', default='lognormal:1500,0.4', help='Time to first token / full reply')
+    web.add_argument('--token-latency', default='fixed:5', help='Delay between streamed tokens')
+    web.add_argument('--astra-latency', default='uniform:30,120')
+    web.add_argument('--mongo-latency', default='uniform:2,10')
+
+    ingestion = sub.add_parser('ingestion', help='Run FootballDataIngestion against fakes')
+    ingestion.add_argument('--pages', type=int, default=100)
+    ingestion.add_argument('--paragraphs', type=int, default=40, help='Paragraphs per synthetic page')
+    ingestion.add_argument('--sequential', action='store_true', help='Use the legacy per-chunk mode')
+    ingestion.add_argument('--page-store', help='Keep fetched pages here between runs (default: a temp dir)')
+    ingestion.add_argument('--offline', action='store_true', help='Ingest from --page-store only')
+    ingestion.add_argument('--fetch-latency', default='uniform:100,400')
+    ingestion.add_argument('--embedding-latency', default='uniform:200,600')
+    ingestion.add_argument('--astra-latency', default='uniform:50,150')
+
+    args = parser.parse_args()
+    if args.scenario == 'web':
+        run_web(args)
+    else:
+        run_ingestion(args)
+
+
+if __name__ == '__main__':
+    main()
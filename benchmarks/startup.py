@@ -0,0 +1,100 @@
+# Cold-start benchmark for the web process.
+#
+# Each run starts a fresh interpreter, imports `main` and serves the first
+# request through the Flask test client, so nothing is shared between runs.
+#
+#   python benchmarks/startup.py --runs 5 --max-import-ms 1500 --max-first-request-ms 300
+#
+# Exits with status 1 when a median exceeds its budget, so it can gate CI.
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = r"""
+import json, sys, time
+t0 = time.perf_counter()
+import main
+t1 = time.perf_counter()
+client = main.app.test_client()
+response = client.get(sys.argv[1])
+t2 = time.perf_counter()
+print(json.dumps({
+    'import_ms': (t1 - t0) * 1000,
+    'first_request_ms': (t2 - t1) * 1000,
+    'status': response.status_code,
+    'modules': len(sys.modules),
+}))
+"""
+
+
+def run_once(path: str) -> dict:
+    env = dict(os.environ)
+    # Startup must not depend on reachable services or real credentials
+    env.setdefault('PREWARM_MODE', 'off')
+    result = subprocess.run(
+        [sys.executable, '-c', CHILD, path],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def top_imports(limit: int = 15) -> list:
+    """Slowest modules by cumulative import time (python -X importtime)."""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import main'],
+        cwd=ROOT, capture_output=True, text=True
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        _, cumulative_us, name = line[len('import time:'):].split('|')
+        if not cumulative_us.strip().isdigit():
+            continue  # header line
+        rows.append((int(cumulative_us), name.strip()))
+    rows.sort(reverse=True)
+    return [{'module': name, 'cumulative_ms': round(us / 1000, 1)} for us, name in rows[:limit]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Cold-start benchmark for the web process')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--path', default='/', help='Path of the first request')
+    parser.add_argument('--max-import-ms', type=float, default=None)
+    parser.add_argument('--max-first-request-ms', type=float, default=None)
+    parser.add_argument('--importtime', action='store_true', help='Also list the slowest imports')
+    args = parser.parse_args()
+
+    runs = [run_once(args.path) for _ in range(args.runs)]
+    report = {
+        'runs': args.runs,
+        'path': args.path,
+        'status': runs[-1]['status'],
+        'modules': runs[-1]['modules'],
+        'import_ms_median': round(statistics.median(r['import_ms'] for r in runs), 1),
+        'import_ms_max': round(max(r['import_ms'] for r in runs), 1),
+        'first_request_ms_median': round(statistics.median(r['first_request_ms'] for r in runs), 1),
+        'first_request_ms_max': round(max(r['first_request_ms'] for r in runs), 1),
+    }
+    if args.importtime:
+        report['slowest_imports'] = top_imports()
+    print(json.dumps(report, indent=2))
+
+    failed = False
+    if args.max_import_ms is not None and report['import_ms_median'] > args.max_import_ms:
+        print(f"FAIL: import {report['import_ms_median']}ms > {args.max_import_ms}ms", file=sys.stderr)
+        failed = True
+    if args.max_first_request_ms is not None and report['first_request_ms_median'] > args.max_first_request_ms:
+        print(f"FAIL: first request {report['first_request_ms_median']}ms > {args.max_first_request_ms}ms",
+              file=sys.stderr)
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
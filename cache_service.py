@@ -0,0 +1,350 @@
+# In-process caches used on the chat request path
+import asyncio
+import hashlib
+import logging
+import math
+import operator
+import os
+import queue
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from collections import OrderedDict
+
+
+def normalize_query(text: str) -> str:
+    """Chuẩn hoá câu hỏi để làm cache key: NFC, gộp khoảng trắng, casefold (giữ nguyên dấu tiếng Việt)."""
+    text = unicodedata.normalize('NFC', text)
+    text = ' '.join(text.split()).casefold()
+    # casefold can emit combining marks (e.g. 'İ'), so recompose afterwards
+    return unicodedata.normalize('NFC', text)
+
+
+class TTLCache:
+    """Bounded LRU cache with a per-entry TTL, safe to share between threads."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key, default=None):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            expires_at, value = entry
+            if expires_at <= now:
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl: float = None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.pop(key, None)
+            return default if entry is None else entry[1]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        return {
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+        }
+
+
+class QueryEmbeddingCache:
+    """Cache of query embeddings keyed on the normalized question.
+
+    Vectors are held as float32 arrays in a TTLCache. If `path` is set, entries
+    are also written through to a SQLite file so a restarted worker can warm
+    start from it instead of re-embedding popular questions.
+
+    The SQLite tier never runs on the caller's thread when called from the
+    event loop: `aget`/`aget_many` read it in a worker thread, and `set` only
+    queues the row for a background writer thread (a full queue drops the disk
+    write, the memory tier still has the vector).
+    """
+
+    def __init__(self, maxsize: int, ttl: float, path: str = None, namespace: str = '',
+                 max_pending_writes: int = 1024):
+        self.namespace = namespace
+        self._memory = TTLCache(maxsize, ttl)
+        self._disk = None
+        self._disk_lock = threading.Lock()
+        self._writes = queue.Queue(maxsize=max_pending_writes)
+        self._writer = None
+        self._writer_pid = None
+        self._writer_lock = threading.Lock()
+        self.disk_hits = 0
+        self.disk_writes_dropped = 0
+        if path:
+            self._open_disk(path)
+
+    def _key(self, query: str) -> str:
+        return f"{self.namespace}:{normalize_query(query)}"
+
+    def _open_disk(self, path: str):
+        try:
+            self._disk = sqlite3.connect(path, timeout=5, check_same_thread=False)
+            self._disk.execute('PRAGMA journal_mode=WAL')
+            self._disk.execute(
+                'CREATE TABLE IF NOT EXISTS query_embeddings '
+                '(key TEXT PRIMARY KEY, created_at REAL NOT NULL, vector BLOB NOT NULL)'
+            )
+            self._disk.commit()
+            self._warm_start()
+        except sqlite3.Error as e:
+            logging.error(f"Query embedding cache: cannot open {path}, using memory only: {e}")
+            self._disk = None
+
+    def _warm_start(self):
+        """Load the most recent entries that are still within the TTL."""
+        cutoff = time.time() - self._memory.ttl
+        with self._disk_lock:
+            self._disk.execute('DELETE FROM query_embeddings WHERE created_at <= ?', (cutoff,))
+            self._disk.commit()
+            rows = self._disk.execute(
+                'SELECT key, created_at, vector FROM query_embeddings ORDER BY created_at DESC LIMIT ?',
+                (self._memory.maxsize,)
+            ).fetchall()
+        # Oldest first so the most recent entries end up at the LRU head
+        for key, created_at, blob in reversed(rows):
+            self._memory.set(key, self._from_blob(blob), ttl=created_at + self._memory.ttl - time.time())
+        logging.info(f"Query embedding cache warm-started with {len(rows)} entries.")
+
+    @staticmethod
+    def _from_blob(blob: bytes) -> array:
+        vector = array('f')
+        vector.frombytes(blob)
+        return vector
+
+    def _read_disk(self, keys: list) -> dict:
+        """key -> vector for the keys found on disk (and still fresh); promotes them to memory."""
+        found = {}
+        with self._disk_lock:
+            rows = [(key, self._disk.execute(
+                'SELECT created_at, vector FROM query_embeddings WHERE key = ?', (key,)
+            ).fetchone()) for key in keys]
+        for key, row in rows:
+            if row and row[0] + self._memory.ttl > time.time():
+                vector = self._from_blob(row[1])
+                self._memory.set(key, vector, ttl=row[0] + self._memory.ttl - time.time())
+                self.disk_hits += 1
+                found[key] = vector
+        return found
+
+    def get(self, query: str):
+        """Trả về vector (list[float]) nếu có trong cache, ngược lại None. Blocking: not for the event loop."""
+        key = self._key(query)
+        vector = self._memory.get(key)
+        if vector is None and self._disk is not None:
+            # Another worker may have embedded this question since we warm-started
+            vector = self._read_disk([key]).get(key)
+        return vector.tolist() if vector is not None else None
+
+    async def aget(self, query: str):
+        """get() for coroutines: the disk lookup runs in a worker thread."""
+        return (await self.aget_many([query]))[0]
+
+    async def aget_many(self, queries: list) -> list:
+        """Cached vector (or None) per query, with a single disk round trip for all memory misses."""
+        keys = [self._key(query) for query in queries]
+        vectors = [self._memory.get(key) for key in keys]
+        missing = [key for key, vector in zip(keys, vectors) if vector is None]
+        if missing and self._disk is not None:
+            found = await asyncio.to_thread(self._read_disk, list(dict.fromkeys(missing)))
+            vectors = [vector if vector is not None else found.get(key) for key, vector in zip(keys, vectors)]
+        return [vector.tolist() if vector is not None else None for vector in vectors]
+
+    def set(self, query: str, vector):
+        key = self._key(query)
+        packed = array('f', vector)
+        self._memory.set(key, packed)
+        if self._disk is not None:
+            self._ensure_writer()
+            try:
+                self._writes.put_nowait((key, time.time(), packed.tobytes()))
+            except queue.Full:
+                self.disk_writes_dropped += 1
+
+    def _ensure_writer(self):
+        if self._writer is not None and self._writer_pid == os.getpid():
+            return
+        with self._writer_lock:
+            if self._writer is None or self._writer_pid != os.getpid():
+                # After a fork the parent's thread does not exist in this process
+                if self._writer_pid is not None:
+                    self._writes = queue.Queue(maxsize=self._writes.maxsize)
+                self._writer = threading.Thread(target=self._write_rows, name='query-cache-writer', daemon=True)
+                self._writer.start()
+                self._writer_pid = os.getpid()
+
+    def _write_rows(self):
+        """Background thread: write queued rows, one transaction per burst."""
+        while True:
+            rows = [self._writes.get()]
+            while len(rows) < 100:
+                try:
+                    rows.append(self._writes.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                with self._disk_lock:
+                    self._disk.executemany(
+                        'INSERT OR REPLACE INTO query_embeddings (key, created_at, vector) VALUES (?, ?, ?)', rows
+                    )
+                    self._disk.commit()
+            except sqlite3.Error as e:
+                logging.warning(f"Query embedding cache: disk write of {len(rows)} entries failed: {e}")
+
+    def stats(self) -> dict:
+        stats = self._memory.stats()
+        stats['disk_hits'] = self.disk_hits
+        stats['disk_writes_pending'] = self._writes.qsize()
+        stats['disk_writes_dropped'] = self.disk_writes_dropped
+        stats['disk_enabled'] = self._disk is not None
+        return stats
+
+
+def build_query_embedding_cache(namespace: str = '') -> QueryEmbeddingCache:
+    """Create the query embedding cache from environment settings."""
+    return QueryEmbeddingCache(
+        maxsize=int(os.environ.get('QUERY_CACHE_SIZE', 2048)),
+        ttl=float(os.environ.get('QUERY_CACHE_TTL', 7 * 24 * 3600)),
+        path=os.environ.get('QUERY_CACHE_PATH') or None,
+        namespace=namespace,
+    )
+
+
+def _unit(vector) -> array:
+    norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+    return array('f', (x / norm for x in vector))
+
+
+class SemanticAnswerCache:
+    """Cache of GPT replies reused for semantically equivalent questions.
+
+    A cached reply is returned only when the retrieved context is identical
+    (same hash) and the cosine similarity between the query embeddings is at
+    least `threshold`. Entries are evicted least-recently-used beyond
+    `maxsize` and expire after `ttl` seconds.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, threshold: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.threshold = threshold
+        self._entries = OrderedDict()  # entry id -> (expires_at, context hash, unit vector, reply)
+        self._by_context = {}  # context hash -> set of entry ids
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _context_hash(context: str) -> str:
+        return hashlib.sha1(context.encode('utf-8')).hexdigest()
+
+    def _remove(self, entry_id):
+        _, context_hash, _, _ = self._entries.pop(entry_id)
+        ids = self._by_context.get(context_hash)
+        if ids is not None:
+            ids.discard(entry_id)
+            if not ids:
+                del self._by_context[context_hash]
+
+    def lookup(self, query_vector, context: str):
+        """Trả về câu trả lời đã cache nếu có câu hỏi đủ giống với cùng ngữ cảnh, ngược lại None."""
+        context_hash = self._context_hash(context)
+        query = _unit(query_vector)
+        now = time.monotonic()
+        with self._lock:
+            best_id, best_score = None, self.threshold
+            for entry_id in list(self._by_context.get(context_hash, ())):
+                expires_at, _, vector, _ = self._entries[entry_id]
+                if expires_at <= now:
+                    self._remove(entry_id)
+                    self.expirations += 1
+                    continue
+                score = sum(map(operator.mul, query, vector))
+                if score >= best_score:
+                    best_id, best_score = entry_id, score
+            if best_id is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(best_id)
+            self.hits += 1
+            return self._entries[best_id][3]
+
+    def store(self, query_vector, context: str, reply: str):
+        context_hash = self._context_hash(context)
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = (time.monotonic() + self.ttl, context_hash, _unit(query_vector), reply)
+            self._by_context.setdefault(context_hash, set()).add(entry_id)
+            while len(self._entries) > self.maxsize:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self):
+        """Xoá toàn bộ cache, ví dụ sau khi collection được ingest lại."""
+        with self._lock:
+            self._entries.clear()
+            self._by_context.clear()
+            self.invalidations += 1
+
+    def stats(self) -> dict:
+        return {
+            'size': len(self._entries),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'invalidations': self.invalidations,
+        }
+
+
+def build_semantic_answer_cache() -> SemanticAnswerCache:
+    """Create the semantic answer cache from environment settings."""
+    return SemanticAnswerCache(
+        maxsize=int(os.environ.get('ANSWER_CACHE_SIZE', 1000)),
+        ttl=float(os.environ.get('ANSWER_CACHE_TTL', 6 * 3600)),
+        threshold=float(os.environ.get('ANSWER_CACHE_THRESHOLD', 0.95)),
+    )
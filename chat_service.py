@@ -1,76 +1,239 @@
 # RAG Chat Service with OpenAI and AstraDB
+import asyncio
 import os
-from openai import OpenAI
-from astrapy import DataAPIClient
+import threading
 import logging
+import time
+from cache_service import build_query_embedding_cache, build_semantic_answer_cache, normalize_query
+from context_builder import build_context_builder
+from embeddings import EMBEDDING_MODEL, embedding_dimensions, request_options
+from metrics import CONTEXT_TOKENS, STAGE_SECONDS, record_usage, span
+from rate_limiter import BATCH, INTERACTIVE, LimitExceeded, budget_from_env, build_openai_limiter
+from singleflight import SingleFlight
 
-logging.basicConfig(level=logging.DEBUG)
+NO_CONTEXT = "Không tìm thấy ngữ cảnh liên quan."
+CONTEXT_ERROR = "Không thể lấy ngữ cảnh từ DB."
 
 class ChatService:
     def __init__(self):
+        # Heavy client libraries are imported here, not at module import, to keep cold start fast
+        import httpx
+        from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+        from astrapy import DataAPIClient
+
         # Initialize OpenAI
+        # Async clients: every call runs on the worker's long-lived loop (async_runtime)
         openai_key = os.environ.get('OPENAI_API_KEY', '')
-        self.openai_client = OpenAI(api_key=openai_key)
+        max_connections = int(os.environ.get('OPENAI_MAX_CONNECTIONS', 500))
+        self.openai_client = AsyncOpenAI(
+            api_key=openai_key,
+            # Retries are done by self.limiter, which also honours Retry-After across calls
+            max_retries=0,
+            http_client=DefaultAsyncHttpxClient(
+                limits=httpx.Limits(max_connections=max_connections,
+                                    max_keepalive_connections=max_connections // 5)
+            )
+        )
         
         # Initialize Astra DB
         astra_endpoint = os.environ.get('ASTRA_DB_ENDPOINT', '')
         astra_token = os.environ.get('ASTRA_DB_APPLICATION_TOKEN', '')
         self.astra_client = DataAPIClient()
-        self.db = self.astra_client.get_database(
+        self.db = self.astra_client.get_async_database(
             astra_endpoint,
             token=astra_token
         )
         self.collection_name = os.environ.get('ASTRA_DB_COLLECTION', 'phucgpt')
+        # Collection handle is created once and reused by every query
+        self.collection = self.db.get_collection(self.collection_name)
+
+        # Retrieval backend: "astra" (remote vector search) or "local" (vector_index snapshot)
+        self.retrieval_top_k = int(os.environ.get('RETRIEVAL_TOP_K', 3))
+        # Query vectors must have the size the collection was built with (EMBEDDING_DIMENSIONS)
+        self.embedding_model = EMBEDDING_MODEL
+        self.embedding_dimensions = embedding_dimensions(self.embedding_model)
+        self.embedding_options = request_options(self.embedding_dimensions, self.embedding_model)
+        self.local_index = None
+        if os.environ.get('RETRIEVAL_BACKEND', 'astra') == 'local':
+            self.local_index = self._load_local_index()
+        self.chat_model = 'gpt-4'
+
+        # Concurrency, RPM/TPM budgets and retries for every OpenAI call of this worker
+        self.limiter = build_openai_limiter()
+        self.limiter.set_budget(self.embedding_model, **budget_from_env('OPENAI_EMBEDDING'))
+        self.limiter.set_budget(self.chat_model, **budget_from_env('OPENAI_CHAT'))
+        self.completion_token_estimate = int(os.environ.get('OPENAI_COMPLETION_TOKEN_ESTIMATE', 500))
+
+        # Cache of query vectors, keyed on the normalized question (and the vector size)
+        namespace = self.embedding_model
+        if self.embedding_options:
+            namespace = f'{namespace}:{self.embedding_dimensions}'
+        self.embedding_cache = build_query_embedding_cache(namespace=namespace)
+        # Replies reused for near-identical questions with the same retrieved context
+        self.answer_cache = build_semantic_answer_cache()
+        # Merges overlapping chunks and fits the context to CONTEXT_MAX_TOKENS
+        self.context_builder = build_context_builder(model=self.chat_model)
+        # Concurrent identical questions share one embedding / search / completion
+        self.coalesce = os.environ.get('COALESCE_REQUESTS', '1') != '0'
+        coalesce_timeout = float(os.environ.get('COALESCE_TIMEOUT', 120))
+        self.chat_flights = SingleFlight('chat', timeout=coalesce_timeout)
+        self.prepare_flights = SingleFlight('prepare', timeout=coalesce_timeout)
+        # Questions of one /api/chat/batch request answered at the same time
+        self.batch_concurrency = int(os.environ.get('CHAT_BATCH_CONCURRENCY', 8))
+
+    def _load_local_index(self):
+        from vector_index import LocalVectorIndex, DEFAULT_INDEX_DIR
+        try:
+            index = LocalVectorIndex(
+                os.environ.get('LOCAL_INDEX_DIR', DEFAULT_INDEX_DIR),
+                refresh_interval=float(os.environ.get('LOCAL_INDEX_REFRESH', 60)),
+                quantize=os.environ.get('LOCAL_INDEX_QUANTIZE') or None
+            )
+        except Exception as error:
+            logging.error(f'Local vector index unavailable, using Astra: {error}')
+            return None
+        if not index.available:
+            logging.warning('Local vector index has no snapshot yet (run `python vector_index.py sync`), using Astra')
+        elif index.dimension != self.embedding_dimensions:
+            logging.error(f'Local vector index has {index.dimension}-d vectors but EMBEDDING_DIMENSIONS is '
+                          f'{self.embedding_dimensions} (re-run `python vector_index.py sync`), using Astra')
+            return None
+        return index
+
+    async def search_chunks(self, query_vector: list) -> list:
+        """Top-k documents for the query vector, from the local replica when available."""
+        if self.local_index is not None and self.local_index.available:
+            # numpy releases the GIL during the matrix product
+            return await asyncio.to_thread(self.local_index.search, query_vector, self.retrieval_top_k)
+
+        results = self.collection.find(
+            {},
+            sort={"$vector": query_vector},
+            limit=self.retrieval_top_k
+        )
+        return [doc async for doc in results]
+
+    def limiter_stats(self) -> dict:
+        return self.limiter.stats()
+
+    def cache_stats(self) -> dict:
+        """Hit/miss/eviction counters of the caches on the chat path."""
+        return {
+            'query_embeddings': self.embedding_cache.stats(),
+            'answers': self.answer_cache.stats(),
+        }
+
+    def invalidate_answer_cache(self):
+        """Drop cached replies, e.g. after the collection has been re-ingested."""
+        self.answer_cache.invalidate()
+        logging.info('Answer cache invalidated')
+
+    async def embed_query(self, query: str) -> list:
+        """Create (or reuse a cached) embedding for the query"""
+        query_vector = await self.embedding_cache.aget(query)
+        if query_vector is not None:
+            logging.info('Step 1: Query embedding served from cache')
+            return query_vector
+
+        logging.info('Step 1: Creating embedding for query...')
+        with span('embed_query'):
+            embedding_response = await self.limiter.call(
+                self.embedding_model,
+                lambda: self.openai_client.embeddings.create(
+                    model=self.embedding_model,
+                    input=query,
+                    encoding_format="float",
+                    **self.embedding_options
+                ),
+                tokens=len(query) // 3 + 1
+            )
+        record_usage(self.embedding_model, getattr(embedding_response, 'usage', None))
+        query_vector = embedding_response.data[0].embedding
+        self.embedding_cache.set(query, query_vector)
+        return query_vector
+
+    async def embed_queries(self, queries: list, priority: int = INTERACTIVE) -> list:
+        """Embeddings for many queries: cached ones reused, all others in one embeddings request."""
+        vectors = await self.embedding_cache.aget_many(queries)
+        # Identical questions (after normalization) are embedded once
+        missing = {}
+        for query, vector in zip(queries, vectors):
+            if vector is None:
+                missing.setdefault(normalize_query(query), query)
+        if missing:
+            inputs = list(missing.values())
+            logging.info(f'Step 1: Creating {len(inputs)} embeddings in one request '
+                         f'({len(queries) - len(inputs)} cached or repeated)')
+            with span('embed_batch'):
+                embedding_response = await self.limiter.call(
+                    self.embedding_model,
+                    lambda: self.openai_client.embeddings.create(
+                        model=self.embedding_model,
+                        input=inputs,
+                        encoding_format="float",
+                        **self.embedding_options
+                    ),
+                    tokens=sum(len(query) // 3 + 1 for query in inputs),
+                    priority=priority
+                )
+            record_usage(self.embedding_model, getattr(embedding_response, 'usage', None))
+            embedded = {}
+            for item in embedding_response.data:
+                query = inputs[item.index]
+                self.embedding_cache.set(query, item.embedding)
+                embedded[normalize_query(query)] = item.embedding
+            vectors = [vector if vector is not None else embedded[normalize_query(query)]
+                       for query, vector in zip(queries, vectors)]
+        return vectors
     
-    async def retrieve_context(self, query: str) -> str:
+    async def retrieve_context(self, query: str, query_vector: list = None) -> str:
         """Retrieve relevant context from AstraDB using vector similarity search"""
+        with span('retrieve_context'):
+            return await self._retrieve_context(query, query_vector)
+
+    async def _retrieve_context(self, query: str, query_vector: list = None) -> str:
         try:
-            logging.info('Step 1: Creating embedding for query...')
-            # Create embedding for the query
-            embedding_response = self.openai_client.embeddings.create(
-                model="text-embedding-3-small",
-                input=query,
-                encoding_format="float"
-            )
-            query_vector = embedding_response.data[0].embedding
+            if query_vector is None:
+                query_vector = await self.embed_query(query)
             logging.info(f'Step 2: Query vector ready, length: {len(query_vector)}')
             
-            # Search in AstraDB
+            # Search in AstraDB (or its local replica)
             logging.info('Step 3: Searching DB...')
-            collection = self.db.get_collection(self.collection_name)
-            results = collection.find(
-                {},
-                sort={"$vector": query_vector},
-                limit=3
-            )
+            with span('vector_search'):
+                results = await self.search_chunks(query_vector)
             
             # Extract text from results
-            texts = []
+            chunks = []
             for doc in results:
                 text = doc.get('text', '') or doc.get('body', '') or doc.get('content', '') or doc.get('chunk', '')
                 if len(text) > 10:
-                    texts.append(text)
+                    chunks.append({'text': text, 'source': doc.get('source', '')})
             
-            logging.info(f'Step 4: Found {len(texts)} relevant chunks')
+            logging.info(f'Step 4: Found {len(chunks)} relevant chunks')
             
-            if not texts:
-                return "Không tìm thấy ngữ cảnh liên quan." 
+            if not chunks:
+                return NO_CONTEXT
             
-            return '\n\n---\n\n'.join(texts)
+            tokens = self.context_builder.tokens
+            if tokens.needs_load:
+                # The first load (or a retry after a failure) may download the BPE file;
+                # do it off the event loop so other requests keep running
+                await asyncio.to_thread(tokens.load)
+            with span('build_context'):
+                built = self.context_builder.build(chunks)
+            CONTEXT_TOKENS.inc(built.raw_tokens, kind='raw')
+            CONTEXT_TOKENS.inc(built.tokens, kind='used')
+            logging.info(f'Step 5: Context {built.tokens} tokens in {built.blocks} blocks '
+                         f'({built.tokens_saved} tokens saved, truncated={built.truncated})')
+            return built.text
             
         except Exception as error:
             logging.error(f'Retrieve context failed: {str(error)}')
-            return "Không thể lấy ngữ cảnh từ DB."
+            return CONTEXT_ERROR
     
-    async def chat(self, message: str) -> str:
-        """Chat with RAG - retrieve context and generate response"""
-        try:
-            # Retrieve context
-            context = await self.retrieve_context(message)
-            logging.info(f'Retrieved context preview: {context[:100]}...')
-            
-            # Create system prompt with context
-            system_prompt = f"""Bạn là một chuyên gia về bóng đá, tên là FootBallGPT.
+    def _build_messages(self, message: str, context: str) -> list:
+        """Create system prompt with context"""
+        system_prompt = f"""Bạn là một chuyên gia về bóng đá, tên là FootBallGPT.
 Nhiệm vụ của bạn là trả lời câu hỏi của người dùng CHỈ dựa trên ngữ cảnh về bóng đá được cung cấp dưới đây.
 
 1.  Nếu ngữ cảnh có chứa thông tin liên quan, hãy sử dụng nó để trả lời một cách chính xác và hữu ích.
@@ -80,22 +243,180 @@ Ví dụ cách từ chối: "Xin lỗi, kiến thức của tôi chỉ giới h
 
 Ngữ cảnh từ database:
 {context}"""
-            
+        return [
+            {'role': 'system', 'content': system_prompt},
+            {'role': 'user', 'content': message}
+        ]
+
+    async def _prepare(self, message: str, query_vector: list = None):
+        """Embed the question and retrieve its context. Returns (query_vector, context, cached_reply)."""
+        if query_vector is None:
+            query_vector = await self.embed_query(message)
+        context = await self.retrieve_context(message, query_vector)
+        logging.info(f'Retrieved context preview: {context[:100]}...')
+
+        cached_reply = self.answer_cache.lookup(query_vector, context)
+        if cached_reply is not None:
+            logging.info('Reply served from answer cache')
+        return query_vector, context, cached_reply
+
+    def _estimate_tokens(self, messages: list) -> int:
+        """Prompt estimate plus the expected completion, charged to the TPM budget up front."""
+        return sum(len(m['content']) for m in messages) // 3 + self.completion_token_estimate
+
+    def _remember(self, query_vector: list, context: str, reply: str):
+        # Don't pin an answer produced while the DB was unreachable
+        if reply and context != CONTEXT_ERROR:
+            self.answer_cache.store(query_vector, context, reply)
+
+    async def chat(self, message: str) -> str:
+        """Chat with RAG - retrieve context and generate response"""
+        if not self.coalesce:
+            return await self._chat(message)
+        return await self.chat_flights.do(normalize_query(message), lambda: self._chat(message))
+
+    async def chat_batch(self, messages: list) -> list:
+        """Answer many questions at once. Returns a reply or an exception per message, in order.
+
+        The questions are embedded with one request, then searched and completed
+        concurrently (CHAT_BATCH_CONCURRENCY at a time) at batch priority, so a
+        large batch does not hold back interactive chat. Raises LimitExceeded when
+        the shared embeddings request is not admitted, since nothing could be answered.
+        """
+        try:
+            vectors = await self.embed_queries(messages, priority=BATCH)
+        except LimitExceeded:
+            raise
+        except Exception as error:
+            logging.error(f'Batch embedding failed: {str(error)}')
+            return [error] * len(messages)
+
+        slots = asyncio.Semaphore(self.batch_concurrency)
+        # A question repeated in the batch is answered once
+        answers = {}
+
+        async def answer(message, query_vector):
+            async with slots:
+                return await self._chat(message, query_vector, priority=BATCH)
+
+        for message, query_vector in zip(messages, vectors):
+            key = normalize_query(message)
+            if key not in answers:
+                answers[key] = asyncio.ensure_future(answer(message, query_vector))
+        await asyncio.gather(*answers.values(), return_exceptions=True)
+
+        results = []
+        for message in messages:
+            task = answers[normalize_query(message)]
+            if task.cancelled():
+                # exception() / result() would raise CancelledError and abort the whole batch
+                results.append(RuntimeError('Request cancelled'))
+            else:
+                results.append(task.exception() or task.result())
+        return results
+
+    async def _chat(self, message: str, query_vector: list = None, priority: int = INTERACTIVE) -> str:
+        try:
+            query_vector, context, cached_reply = await self._prepare(message, query_vector)
+            if cached_reply is not None:
+                return cached_reply
+
             # Call OpenAI
-            response = self.openai_client.chat.completions.create(
-                model='gpt-4',
-                messages=[
-                    {'role': 'system', 'content': system_prompt},
-                    {'role': 'user', 'content': message}
-                ],
-                temperature=0.7
-            )
-            
-            return response.choices[0].message.content
+            messages = self._build_messages(message, context)
+            with span('completion'):
+                response = await self.limiter.call(
+                    self.chat_model,
+                    lambda: self.openai_client.chat.completions.create(
+                        model=self.chat_model,
+                        messages=messages,
+                        temperature=0.7
+                    ),
+                    tokens=self._estimate_tokens(messages),
+                    priority=priority
+                )
+            record_usage(self.chat_model, getattr(response, 'usage', None))
+
+            reply = response.choices[0].message.content
+            self._remember(query_vector, context, reply)
+            return reply
             
         except Exception as error:
             logging.error(f'Chat failed: {str(error)}')
             raise error
 
-# Create singleton instance
-chat_service = ChatService()
\ No newline at end of file
+    async def chat_stream(self, message: str):
+        """Like chat(), but yields the reply token by token as OpenAI streams it.
+
+        Closing the generator early (client disconnected) closes the upstream
+        stream, so OpenAI stops generating.
+        """
+        # Only the preparation is shared: every client gets its own token stream
+        if self.coalesce:
+            prepared = await self.prepare_flights.do(normalize_query(message), lambda: self._prepare(message))
+        else:
+            prepared = await self._prepare(message)
+        query_vector, context, cached_reply = prepared
+        if cached_reply is not None:
+            yield cached_reply
+            return
+
+        started = time.perf_counter()
+        first_token_at = None
+        messages = self._build_messages(message, context)
+        # The stream keeps its limiter slot until it is closed
+        stream, permit = await self.limiter.call(
+            self.chat_model,
+            lambda: self.openai_client.chat.completions.create(
+                model=self.chat_model,
+                messages=messages,
+                temperature=0.7,
+                stream=True,
+                # The last chunk (with empty choices) carries the token usage
+                stream_options={'include_usage': True}
+            ),
+            tokens=self._estimate_tokens(messages),
+            hold=True
+        )
+        parts = []
+        try:
+            async for chunk in stream:
+                if getattr(chunk, 'usage', None) is not None:
+                    record_usage(self.chat_model, chunk.usage)
+                    permit.record_usage(chunk.usage.total_tokens)
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+                        STAGE_SECONDS.observe(first_token_at - started, stage='completion_first_token')
+                    parts.append(delta)
+                    yield delta
+        except Exception as error:
+            logging.error(f'Chat stream failed: {str(error)}')
+            raise
+        finally:
+            permit.release()
+            await stream.close()
+            STAGE_SECONDS.observe(time.perf_counter() - started, stage='completion_stream')
+
+        self._remember(query_vector, context, ''.join(parts))
+
+# Singleton instance, created on first use
+_chat_service = None
+_chat_service_lock = threading.Lock()
+
+
+def get_chat_service() -> ChatService:
+    """Trả về ChatService dùng chung, khởi tạo (thread-safe) ở lần gọi đầu tiên."""
+    global _chat_service
+    if _chat_service is None:
+        with _chat_service_lock:
+            if _chat_service is None:
+                _chat_service = ChatService()
+    return _chat_service
+
+
+def __getattr__(name):
+    # Backwards compatibility for `from chat_service import chat_service`
+    if name == 'chat_service':
+        return get_chat_service()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
\ No newline at end of file
@@ -0,0 +1,52 @@
+// Precompress the Vite build: writes <file>.br and <file>.gz next to every
+// compressible file in dist/, so the Flask app (static_assets.py) can serve
+// them without compressing anything per request.
+//
+//   node scripts/compress.mjs [dist]     (run by `npm run build`)
+import { readdirSync, readFileSync, statSync, unlinkSync, writeFileSync } from 'node:fs'
+import { extname, join, relative } from 'node:path'
+import { brotliCompressSync, constants, gzipSync } from 'node:zlib'
+
+const COMPRESSIBLE = new Set(['.html', '.js', '.mjs', '.css', '.json', '.svg', '.txt', '.xml', '.map', '.wasm'])
+// Below this, the Content-Encoding header costs about what compression saves
+const MIN_SIZE = 1024
+
+const dist = process.argv[2] ?? 'dist'
+
+function* files(dir) {
+  for (const entry of readdirSync(dir, { withFileTypes: true })) {
+    const path = join(dir, entry.name)
+    if (entry.isDirectory()) yield* files(path)
+    else yield path
+  }
+}
+
+function write(path, original, compressed) {
+  // A variant that is not smaller is useless; remove any stale one from a previous build
+  if (compressed.length < original.length) {
+    writeFileSync(path, compressed)
+    return compressed.length
+  }
+  try { unlinkSync(path) } catch {}
+  return null
+}
+
+let count = 0
+let before = 0
+let after = 0
+for (const path of files(dist)) {
+  if (!COMPRESSIBLE.has(extname(path)) || statSync(path).size < MIN_SIZE) continue
+  const data = readFileSync(path)
+  const br = write(`${path}.br`, data, brotliCompressSync(data, {
+    params: {
+      [constants.BROTLI_PARAM_QUALITY]: constants.BROTLI_MAX_QUALITY,
+      [constants.BROTLI_PARAM_SIZE_HINT]: data.length,
+    },
+  }))
+  write(`${path}.gz`, data, gzipSync(data, { level: 9 }))
+  count += 1
+  before += data.length
+  after += br ?? data.length
+  console.log(`  ${relative(dist, path)}: ${data.length} -> ${br ?? '-'} bytes (br)`)
+}
+console.log(`Precompressed ${count} files: ${before} -> ${after} bytes with brotli`)
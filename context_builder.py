@@ -0,0 +1,240 @@
+# Assemble retrieved chunks into the prompt context within a token budget
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+
+SEPARATOR = '\n\n---\n\n'
+
+
+@dataclass
+class BuiltContext:
+    text: str
+    tokens: int
+    raw_tokens: int                 # what joining the chunks verbatim would have cost
+    chunks: int                     # chunks received
+    blocks: int                     # blocks left after merging / deduplication
+    truncated: bool = False
+    sources: list = field(default_factory=list)
+
+    @property
+    def tokens_saved(self) -> int:
+        return max(self.raw_tokens - self.tokens, 0)
+
+
+class TokenCounter:
+    """tiktoken encoding for the chat model, loaded on first use.
+
+    tiktoken downloads its BPE file on the first load (cached under
+    TIKTOKEN_CACHE_DIR); if that fails we fall back to a conservative
+    character estimate rather than failing the chat request, and try
+    loading again once `retry_after` seconds have passed.
+    """
+
+    def __init__(self, model: str, retry_after: float = 60.0):
+        self.model = model
+        self.retry_after = retry_after
+        self._encoding = None
+        self._retry_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def needs_load(self) -> bool:
+        """True when the next count would (re)try loading the encoding, which may download it."""
+        return self._encoding is None and time.monotonic() >= self._retry_at
+
+    def load(self):
+        """Load the encoding now if it is due; returns it, or None while falling back."""
+        return self._get_encoding()
+
+    def _get_encoding(self):
+        if self.needs_load:
+            with self._lock:
+                if self.needs_load:
+                    try:
+                        import tiktoken
+                        try:
+                            self._encoding = tiktoken.encoding_for_model(self.model)
+                        except KeyError:
+                            self._encoding = tiktoken.get_encoding('cl100k_base')
+                    except Exception as e:
+                        self._retry_at = time.monotonic() + self.retry_after
+                        logging.warning(f'Tokenizer unavailable, estimating token counts '
+                                        f'(retrying in {self.retry_after:.0f}s): {e}')
+        return self._encoding
+
+    def count(self, text: str) -> int:
+        encoding = self._get_encoding()
+        if encoding is None:
+            return len(text) // 3 + 1
+        return len(encoding.encode(text, disallowed_special=()))
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        if max_tokens <= 0:
+            return ''
+        encoding = self._get_encoding()
+        if encoding is None:
+            return text[:(max_tokens - 1) * 3]
+        tokens = encoding.encode(text, disallowed_special=())
+        if len(tokens) <= max_tokens:
+            return text
+        # Drop a trailing partial character the cut may have produced
+        return encoding.decode(tokens[:max_tokens]).rstrip('\ufffd')
+
+
+def _overlap(a: str, b: str, min_overlap: int) -> int:
+    """Length of the longest suffix of `a` that is a prefix of `b` (0 if < min_overlap)."""
+    if len(b) < min_overlap or len(a) < min_overlap:
+        return 0
+    probe = b[:min_overlap]
+    start = max(len(a) - len(b), 0)
+    while True:
+        position = a.find(probe, start)
+        if position < 0:
+            return 0
+        length = len(a) - position
+        if b.startswith(a[position:]):
+            return length
+        start = position + 1
+
+
+def merge_overlapping(texts: list, min_overlap: int = 40) -> list:
+    """Merge chunks of one page whose ends overlap (split_text's chunk_overlap) and drop contained ones."""
+    pieces = [t for t in texts if t]
+    merged = True
+    while merged and len(pieces) > 1:
+        merged = False
+        for i in range(len(pieces)):
+            for j in range(len(pieces)):
+                if i == j:
+                    continue
+                a, b = pieces[i], pieces[j]
+                if b in a:
+                    combined = a
+                else:
+                    length = _overlap(a, b, min_overlap)
+                    if not length:
+                        continue
+                    combined = a + b[length:]
+                # Keep the earlier (higher-ranked) position for the merged block
+                keep, drop = min(i, j), max(i, j)
+                pieces[keep] = combined
+                del pieces[drop]
+                merged = True
+                break
+            if merged:
+                break
+    return pieces
+
+
+def merge_page_chunks(texts: list, min_overlap: int = 40) -> list:
+    """Merge the chunks of one page.
+
+    The structured chunker starts every chunk with its "Title > Section" path
+    and carries whole sentences, not characters, over to the next chunk, so
+    its chunks never overlap end to start. Chunks sharing a first line are
+    grouped under one copy of it and their bodies merged; the rest (legacy
+    split_text chunks) go through merge_overlapping as they are.
+    """
+    first_lines = Counter(text.partition('\n')[0] for text in texts if '\n' in text)
+    # header (None for chunks without a shared one) -> texts, in rank order of the first chunk
+    sections = {}
+    for text in texts:
+        header, newline, body = text.partition('\n')
+        if newline and first_lines[header] > 1:
+            sections.setdefault(header, []).append(body)
+        else:
+            sections.setdefault(None, []).append(text)
+    pieces = []
+    for header, group in sections.items():
+        merged = merge_overlapping(group, min_overlap)
+        if header is None:
+            pieces.extend(merged)
+        else:
+            pieces.append('\n'.join([header] + merged))
+    return pieces
+
+
+def _dedupe_lines(text: str, seen: set, min_length: int) -> str:
+    lines = []
+    for line in text.split('\n'):
+        key = ' '.join(line.split()).casefold()
+        if len(key) >= min_length:
+            if key in seen:
+                continue
+            seen.add(key)
+        lines.append(line)
+    return '\n'.join(lines).strip()
+
+
+class ContextBuilder:
+    """Turns ranked search results into a deduplicated, token-budgeted context.
+
+    Chunks from the same `source` are merged where they overlap or share a
+    section path, lines that already appeared earlier in the context are
+    dropped, and blocks are added in rank order until `max_tokens` is reached (the last one is cut at a
+    token boundary if at least `min_tail_tokens` still fit).
+    """
+
+    def __init__(self, max_tokens: int, model: str = 'gpt-4', min_overlap: int = 40,
+                 min_line_length: int = 40, min_tail_tokens: int = 64):
+        self.max_tokens = max_tokens
+        self.min_overlap = min_overlap
+        self.min_line_length = min_line_length
+        self.min_tail_tokens = min_tail_tokens
+        self.tokens = TokenCounter(model)
+
+    def build(self, documents: list) -> BuiltContext:
+        """`documents` are dicts with text and source, best match first."""
+        texts = [(doc.get('text') or '', doc.get('source') or '') for doc in documents]
+        raw_tokens = self.tokens.count(SEPARATOR.join(t for t, _ in texts)) if texts else 0
+
+        # Group by source, ordered by each source's best rank
+        groups = {}
+        for text, source in texts:
+            groups.setdefault(source, []).append(text)
+        blocks = []
+        for source, group in groups.items():
+            pieces = merge_page_chunks(group, self.min_overlap) if source else group
+            blocks.extend((piece, source) for piece in pieces)
+
+        seen_lines = set()
+        parts, sources, used, truncated = [], [], 0, False
+        separator_tokens = self.tokens.count(SEPARATOR)
+        for text, source in blocks:
+            text = _dedupe_lines(text, seen_lines, self.min_line_length)
+            if not text:
+                continue
+            cost = self.tokens.count(text) + (separator_tokens if parts else 0)
+            if used + cost > self.max_tokens:
+                room = self.max_tokens - used - (separator_tokens if parts else 0)
+                if room >= self.min_tail_tokens:
+                    text = self.tokens.truncate(text, room)
+                    parts.append(text)
+                    sources.append(source)
+                    used += self.tokens.count(text) + (separator_tokens if len(parts) > 1 else 0)
+                truncated = True
+                break
+            parts.append(text)
+            sources.append(source)
+            used += cost
+
+        return BuiltContext(
+            text=SEPARATOR.join(parts),
+            tokens=used,
+            raw_tokens=raw_tokens,
+            chunks=len(texts),
+            blocks=len(parts),
+            truncated=truncated,
+            sources=list(dict.fromkeys(s for s in sources if s)),
+        )
+
+
+def build_context_builder(model: str = 'gpt-4') -> ContextBuilder:
+    return ContextBuilder(
+        max_tokens=int(os.environ.get('CONTEXT_MAX_TOKENS', 3000)),
+        model=model,
+        min_overlap=int(os.environ.get('CONTEXT_MIN_OVERLAP', 40)),
+    )
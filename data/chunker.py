@@ -0,0 +1,146 @@
+# Structure-aware chunking of Wikipedia articles for ingestion
+#
+# Articles are reduced to blocks (headings, paragraphs, list items) by
+# html_extract.extract_article and packed into chunks of about
+# `target_tokens`, never crossing a section boundary.
+# Paragraphs that are too long are split at sentence boundaries, and only
+# sentences too long on their own are cut between words.
+import logging
+import math
+import re
+
+HEADING_LEVELS = {'h2': 2, 'h3': 3, 'h4': 4}
+# Sections whose content is references and links
+SKIP_SECTIONS = {
+    'tham khảo', 'chú thích', 'ghi chú', 'liên kết ngoài', 'xem thêm', 'đọc thêm', 'nguồn',
+    'references', 'notes', 'external links', 'see also', 'further reading',
+}
+
+_SENTENCE_END = re.compile(r'(?<=[.!?…])\s+|(?<=[.!?…]["”’)])\s+')
+
+
+def split_sentences(text: str) -> list:
+    sentences = []
+    for part in _SENTENCE_END.split(text):
+        # "TP. Hồ Chí Minh", "v.v. và ..." : a lowercase start means we split too eagerly
+        if sentences and part[:1].islower():
+            sentences[-1] = f'{sentences[-1]} {part}'
+        elif part:
+            sentences.append(part)
+    return sentences
+
+
+class TokenCounter:
+    """cl100k_base token counts (the text-embedding-3 tokenizer), or an estimate without tiktoken."""
+
+    def __init__(self):
+        self._encoding = None
+        try:
+            import tiktoken
+            self._encoding = tiktoken.get_encoding('cl100k_base')
+        except Exception as e:
+            logging.warning(f"tiktoken unavailable, estimating chunk sizes: {e}")
+
+    def __call__(self, text: str) -> int:
+        if self._encoding is None:
+            return len(text) // 3 + 1
+        return len(self._encoding.encode(text, disallowed_special=()))
+
+
+class StructuredChunker:
+    def __init__(self, target_tokens: int = 350, max_tokens: int = 512, overlap_tokens: int = 32,
+                 min_chars: int = 50, count_tokens=None):
+        self.target_tokens = target_tokens
+        self.max_tokens = max(max_tokens, target_tokens)
+        self.overlap_tokens = overlap_tokens
+        self.min_chars = min_chars
+        self.count_tokens = count_tokens or TokenCounter()
+
+    def chunks(self, blocks, title: str = ''):
+        """Generate chunks from (tag, text) blocks; each starts with its section path."""
+        headings = {}
+        paragraphs = []
+        skip_level = None  # level of the reference/links section being skipped, if any
+        for tag, text in blocks:
+            level = HEADING_LEVELS.get(tag)
+            if level is None:
+                if skip_level is None:
+                    paragraphs.append(text)
+                continue
+            yield from self._section(paragraphs, title, headings)
+            paragraphs = []
+            headings = {lvl: h for lvl, h in headings.items() if lvl < level}
+            headings[level] = text
+            if skip_level is None or level <= skip_level:
+                skip_level = level if text.casefold() in SKIP_SECTIONS else None
+        yield from self._section(paragraphs, title, headings)
+
+    def _section(self, paragraphs, title, headings):
+        if not paragraphs:
+            return
+        path = ' > '.join([title] * bool(title) + [headings[lvl] for lvl in sorted(headings)])
+        prefix = f'{path}\n' if path else ''
+        for body in self._pack(self._units(paragraphs)):
+            if len(body) >= self.min_chars:
+                yield prefix + body
+
+    def _units(self, paragraphs):
+        """(text, tokens, separator) pieces no longer than max_tokens."""
+        for paragraph in paragraphs:
+            tokens = self.count_tokens(paragraph)
+            if tokens <= self.max_tokens:
+                yield paragraph, tokens, '\n'
+                continue
+            separator = '\n'
+            for sentence in split_sentences(paragraph):
+                tokens = self.count_tokens(sentence)
+                if tokens <= self.max_tokens:
+                    yield sentence, tokens, separator
+                else:
+                    words = sentence.split()
+                    parts = math.ceil(tokens / self.max_tokens)
+                    step = math.ceil(len(words) / parts)
+                    for start in range(0, len(words), step):
+                        piece = ' '.join(words[start:start + step])
+                        yield piece, self.count_tokens(piece), separator
+                        separator = ' '
+                separator = ' '
+
+    def _pack(self, units):
+        """Greedily pack units up to target_tokens, carrying up to overlap_tokens of trailing units over."""
+        buffer, size, carried = [], 0, 0
+        pending = None  # last packed chunk, held back so a tiny remainder can be merged into it
+        for unit in units:
+            tokens = unit[1]
+            if buffer and size + tokens > self.target_tokens:
+                if pending is not None:
+                    yield _join(pending[0])
+                pending = (buffer, size)
+                carry, carry_size = [], 0
+                for previous in reversed(buffer):
+                    if carry_size + previous[1] > self.overlap_tokens:
+                        break
+                    carry.insert(0, previous)
+                    carry_size += previous[1]
+                if carry_size + tokens > self.max_tokens:
+                    carry, carry_size = [], 0
+                buffer, size, carried = carry, carry_size, len(carry)
+            buffer.append(unit)
+            size += tokens
+
+        if pending is not None:
+            tail = buffer[carried:]
+            tail_size = sum(u[1] for u in tail)
+            if tail_size < self.target_tokens // 4 and pending[1] + tail_size <= self.max_tokens:
+                yield _join(pending[0] + tail)
+                return
+            yield _join(pending[0])
+        if buffer:
+            yield _join(buffer)
+
+
+def _join(units) -> str:
+    text = ''
+    for piece, _, separator in units:
+        text = f'{text}{separator}{piece}' if text else piece
+    return text
@@ -0,0 +1,255 @@
+# Export the embedded chunks of a collection to disk and load them into another one
+#
+#   python collection_snapshot.py export snapshots/phucgpt            # ASTRA_DB_COLLECTION -> directory
+#   python collection_snapshot.py import snapshots/phucgpt            # directory -> ASTRA_DB_COLLECTION
+#   python collection_snapshot.py import snapshots/phucgpt --collection phucgpt_staging
+#
+# Snapshot layout (rows in the same order in both data files):
+#   <dir>/manifest.json        {"format", "count", "dimension", "model", "collection", "created_at", "sha256"}
+#   <dir>/vectors.f32          float32 [count x dimension], as stored in the collection
+#   <dir>/meta.jsonl.gz        {"_id", "text", "source"} per row
+#   <dir>/ingest_manifest.json the ingestion manifest at export time, if there was one
+#
+# Importing makes no OpenAI calls. Documents keep their _id, so re-running an
+# import is harmless, and with the restored ingestion manifest a later
+# data_ingestion.py run only embeds pages that changed since the export.
+import argparse
+import asyncio
+import gzip
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+
+from data_ingestion import FootballDataIngestion
+
+# embeddings lives in the project root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from embeddings import collection_definition  # noqa: E402
+
+FORMAT = 1
+MANIFEST = 'manifest.json'
+VECTORS = 'vectors.f32'
+META = 'meta.jsonl.gz'
+INGEST_MANIFEST = 'ingest_manifest.json'
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while block := f.read(1 << 20):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def read_manifest(directory):
+    with open(os.path.join(directory, MANIFEST), encoding='utf-8') as f:
+        manifest = json.load(f)
+    if manifest.get('format') != FORMAT:
+        raise ValueError(f"Snapshot {directory} has format {manifest.get('format')}, expected {FORMAT}")
+    return manifest
+
+
+def verify_files(directory, manifest):
+    """Check the data files against the sizes and checksums recorded at export."""
+    expected_size = manifest['count'] * manifest['dimension'] * 4
+    actual_size = os.path.getsize(os.path.join(directory, VECTORS))
+    if actual_size != expected_size:
+        raise ValueError(f"{VECTORS} has {actual_size} bytes, expected {expected_size}")
+    for name, checksum in manifest['sha256'].items():
+        if _sha256(os.path.join(directory, name)) != checksum:
+            raise ValueError(f"{name} does not match its checksum, the snapshot is corrupt")
+
+
+def export_snapshot(ingestion, collection_name, directory):
+    """Stream the collection into a new snapshot directory. Returns the manifest."""
+    if os.path.exists(directory):
+        raise FileExistsError(f"{directory} already exists")
+    # Written next to the destination and renamed at the end, so a failed export leaves nothing behind
+    tmp_dir = f"{directory.rstrip(os.sep)}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    collection = ingestion.db.get_collection(collection_name)
+    cursor = collection.find({}, projection={'text': True, 'source': True, '$vector': True})
+    count = skipped = 0
+    dimension = None
+    started = time.perf_counter()
+    with open(os.path.join(tmp_dir, VECTORS), 'wb') as vf, \
+            gzip.open(os.path.join(tmp_dir, META), 'wt', encoding='utf-8') as mf:
+        for doc in cursor:
+            vector = doc.get('$vector')
+            if dimension is None and vector:
+                dimension = len(vector)
+            if not vector or len(vector) != dimension:
+                logging.warning(f"Skipping document {doc.get('_id')}: no {dimension}-d vector")
+                skipped += 1
+                continue
+            vf.write(np.asarray(vector, dtype=np.float32).tobytes())
+            mf.write(json.dumps({'_id': doc['_id'], 'text': doc.get('text', ''), 'source': doc.get('source', '')},
+                                ensure_ascii=False) + '\n')
+            count += 1
+            if count % 10000 == 0:
+                logging.info(f"  exported {count} documents")
+
+    if os.path.exists(ingestion.manifest_path):
+        shutil.copyfile(ingestion.manifest_path, os.path.join(tmp_dir, INGEST_MANIFEST))
+    manifest = {
+        'format': FORMAT,
+        'count': count,
+        'dimension': dimension or 0,
+        'model': ingestion.embedding_model,
+        'collection': collection_name,
+        'created_at': datetime.now().isoformat(),
+        'sha256': {name: _sha256(os.path.join(tmp_dir, name)) for name in (VECTORS, META)},
+    }
+    with open(os.path.join(tmp_dir, MANIFEST), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_dir, directory)
+
+    size = sum(os.path.getsize(os.path.join(directory, name)) for name in (VECTORS, META))
+    logging.info(f"Exported {count} documents ({dimension}-d) from '{collection_name}' to {directory} "
+                 f"in {time.perf_counter() - started:.1f}s, {size / 1e6:.1f} MB; skipped {skipped}.")
+    return manifest
+
+
+def read_rows(directory, manifest, batch_size):
+    """Yield lists of documents rebuilt from the snapshot, batch_size at a time."""
+    count, dimension = manifest['count'], manifest['dimension']
+    if not count:
+        return
+    vectors = np.memmap(os.path.join(directory, VECTORS), dtype=np.float32, mode='r', shape=(count, dimension))
+    batch, row = [], -1
+    with gzip.open(os.path.join(directory, META), 'rt', encoding='utf-8') as f:
+        for row, line in enumerate(f):
+            document = json.loads(line)
+            document['$vector'] = vectors[row].tolist()
+            batch.append(document)
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+    if row + 1 != count:
+        raise ValueError(f"{META} has {row + 1} rows, the manifest says {count}")
+
+
+def stored_count(collection, expected):
+    """Documents in the collection: exact up to the Data API counting limit, estimated above it."""
+    try:
+        return collection.count_documents({}, upper_bound=max(expected, 1)), True
+    except Exception:
+        return collection.estimated_document_count(), False
+
+
+async def import_snapshot(ingestion, directory, target_name, verify=True):
+    """Load a snapshot into target_name with concurrent insert_many batches. Returns documents written."""
+    manifest = read_manifest(directory)
+    if verify:
+        verify_files(directory, manifest)
+    if manifest['model'] != ingestion.embedding_model:
+        logging.warning(f"Snapshot vectors come from {manifest['model']}, the app embeds queries "
+                        f"with {ingestion.embedding_model}")
+
+    if target_name in ingestion.db.list_collection_names():
+        logging.info(f"Collection '{target_name}' already exists, documents with the same _id are replaced.")
+    else:
+        ingestion.db.create_collection(
+            target_name, definition=collection_definition(manifest['dimension'], manifest['model'])
+        )
+        logging.info(f"Collection '{target_name}' created ({manifest['dimension']}-d vectors).")
+    target = ingestion.db.get_collection(target_name)
+
+    slots = asyncio.Semaphore(ingestion.insert_concurrency)
+    inserts = []
+    written = 0
+    failures = []
+    started = time.perf_counter()
+
+    async def insert(first_row, documents):
+        nonlocal written
+        try:
+            await asyncio.to_thread(ingestion.insert_documents, target, documents)
+            written += len(documents)
+        except Exception as e:
+            failures.append(f"rows {first_row}-{first_row + len(documents) - 1}: {e}")
+        finally:
+            slots.release()
+
+    rows = read_rows(directory, manifest, ingestion.insert_batch_size)
+    first_row = 0
+    try:
+        # Stop at the first failed batch rather than loading the rest of the snapshot
+        while not failures and (batch := await asyncio.to_thread(next, rows, None)):
+            await slots.acquire()
+            if failures:
+                break
+            inserts.append(asyncio.create_task(insert(first_row, batch)))
+            first_row += len(batch)
+        if not failures:
+            await asyncio.gather(*inserts)
+    finally:
+        # Batches already sent finish in their threads, but nothing waits for them
+        for task in inserts:
+            task.cancel()
+        await asyncio.gather(*inserts, return_exceptions=True)
+
+    elapsed = time.perf_counter() - started
+    if failures:
+        raise RuntimeError(f"Import failed: {len(failures)} insert batch(es) failed and the rest were cancelled; "
+                           f"{written} of {manifest['count']} documents confirmed written. First failure: {failures[0]}")
+    logging.info(f"Imported {written} documents into '{target_name}' in {elapsed:.1f}s "
+                 f"({written / max(elapsed, 1e-9):.0f} documents/s).")
+    count, exact = stored_count(target, manifest['count'])
+    if written != manifest['count'] or (exact and count < manifest['count']):
+        raise RuntimeError(f"Import incomplete: snapshot has {manifest['count']} documents, "
+                           f"{written} written, collection holds {count if exact else f'~{count}'}")
+    if exact:
+        logging.info(f"Verified: '{target_name}' holds {count} documents.")
+    else:
+        # The estimate can lag behind inserts that just succeeded, so it is not a failure
+        logging.warning(f"Could not count '{target_name}' exactly; the estimate is ~{count} documents "
+                        f"and all {written} were written.")
+
+    snapshot_manifest = os.path.join(directory, INGEST_MANIFEST)
+    if os.path.exists(snapshot_manifest) and not os.path.exists(ingestion.manifest_path):
+        shutil.copyfile(snapshot_manifest, ingestion.manifest_path)
+        logging.info(f"Ingestion manifest restored to {ingestion.manifest_path}.")
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export / import the embedded chunks of a collection')
+    parser.add_argument('command', choices=['export', 'import'])
+    parser.add_argument('directory', help='Snapshot directory')
+    parser.add_argument('--collection', default=os.environ.get('ASTRA_DB_COLLECTION'),
+                        help='Collection to export, or to import into (default: ASTRA_DB_COLLECTION)')
+    # astrapy splits each insert_many into concurrent 50-document requests, so large batches load fastest
+    parser.add_argument('--batch-size', type=int, default=1000, help='Documents per insert_many call')
+    parser.add_argument('--concurrency', type=int, help='Concurrent inserts (default: INGEST_INSERT_CONCURRENCY)')
+    parser.add_argument('--no-verify', action='store_true', help='Skip the checksum check before importing')
+    args = parser.parse_args()
+
+    ingestion = FootballDataIngestion()
+    ingestion.insert_batch_size = args.batch_size
+    if args.concurrency:
+        ingestion.insert_concurrency = args.concurrency
+    if args.command == 'export':
+        export_snapshot(ingestion, args.collection, args.directory)
+        return
+    try:
+        asyncio.run(import_snapshot(ingestion, args.directory, args.collection, verify=not args.no_verify))
+    except (RuntimeError, ValueError, OSError) as e:
+        logging.error(str(e))
+        sys.exit(1)
+    logging.info("Re-run `python vector_index.py sync` if RETRIEVAL_BACKEND=local.")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,12 @@
 # create_collection.py
 import os
+import sys
 from astrapy import DataAPIClient
 from dotenv import load_dotenv
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from embeddings import EMBEDDING_MODEL, collection_definition, embedding_dimensions  # noqa: E402
+
 # Load file .env
 load_dotenv()
 
@@ -10,6 +14,8 @@ load_dotenv()
 token = os.getenv("ASTRA_DB_APPLICATION_TOKEN")
 endpoint = os.getenv("ASTRA_DB_ENDPOINT")
 collection_name = os.getenv("ASTRA_DB_COLLECTION")
+# Số chiều vector: EMBEDDING_DIMENSIONS (mặc định 1536 của text-embedding-3-small)
+dimension = embedding_dimensions(EMBEDDING_MODEL)
 
 if not token or not endpoint or not collection_name:
     raise ValueError("❌ Thiếu thông tin trong file .env (token, endpoint hoặc collection_name)")
@@ -20,25 +26,25 @@ db = client.get_database(endpoint)
 
 def create_collection_if_not_exists():
     try:
-        existing_collections = [col["name"] for col in db.list_collections()]
+        existing_collections = {col.name: col for col in db.list_collections()}
         if collection_name in existing_collections:
-            print(f"✅ Collection '{collection_name}' đã tồn tại.")
+            vector = existing_collections[collection_name].definition.vector
+            existing_dimension = vector.dimension if vector else None
+            print(f"✅ Collection '{collection_name}' đã tồn tại ({existing_dimension} chiều).")
+            if existing_dimension != dimension:
+                print(f"⚠️ EMBEDDING_DIMENSIONS={dimension} khác với collection, "
+                      f"dùng data/migrate_dimensions.py để tạo collection mới.")
         else:
-            # ⚙️ Định nghĩa chuẩn vector 1536 chiều
+            # ⚙️ Định nghĩa vector theo EMBEDDING_DIMENSIONS
             db.create_collection(
                 collection_name,
-                definition={
-                    "vector": {
-                        "dimension": 1536,
-                        "metric": "cosine"
-                    }
-                }
+                definition=collection_definition(dimension, EMBEDDING_MODEL)
             )
-            print(f"✅ Đã tạo collection '{collection_name}' thành công!")
+            print(f"✅ Đã tạo collection '{collection_name}' ({dimension} chiều) thành công!")
 
         print("\n📂 Danh sách collection hiện có:")
-        for col in db.list_collections():
-            print(" -", col["name"])
+        for name in db.list_collection_names():
+            print(" -", name)
 
     except Exception as e:
         print("❌ Lỗi khi tạo hoặc kiểm tra collection:", e)
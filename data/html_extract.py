@@ -0,0 +1,150 @@
+# Text extraction from Wikipedia article HTML
+#
+# Module-level functions only, so they can run in a ProcessPoolExecutor.
+# Two backends:
+#   "html.parser" - BeautifulSoup with the stdlib parser (always available)
+#   "lxml"        - lxml.html directly (C parser, several times faster)
+# "auto" picks lxml when it is installed.
+#
+# They produce the same output for well-formed HTML such as Wikipedia's, but
+# build different trees from malformed nesting: libxml2 closes an open <p> or
+# <li> where a browser would (at a <div>, <table>, the next <p>, ...), while
+# html.parser keeps it open, so the enclosing block also contains what follows
+# and text can repeat ("<p>one<p>two" gives "onetwo" and "two"). Page hashes
+# cover the extracted text, so switching backend re-chunks such pages.
+# benchmarks/html_parsing.py shows both outputs for the known cases.
+from bs4 import BeautifulSoup, UnicodeDammit
+
+CONTENT_ID = 'mw-content-text'
+REMOVED_TAGS = ['table', 'script', 'style', 'sup']
+HEADING_TAGS = ('h2', 'h3', 'h4')
+BLOCK_TAGS = ['h2', 'h3', 'h4', 'p', 'li', 'dd', 'blockquote']
+CONTAINER_TAGS = ('li', 'dd', 'blockquote')
+# Elements inside the article body that are navigation or citations, not prose
+NOISE_CLASSES = ('mw-editsection', 'mw-references-wrap', 'reflist', 'navbox', 'hatnote', 'mw-empty-elt')
+
+try:
+    import lxml.html
+    HAVE_LXML = True
+except ImportError:
+    HAVE_LXML = False
+
+
+def resolve_parser(parser: str = 'auto') -> str:
+    if parser == 'auto':
+        return 'lxml' if HAVE_LXML else 'html.parser'
+    if parser == 'lxml' and not HAVE_LXML:
+        raise ImportError("INGEST_HTML_PARSER=lxml but lxml is not installed (pip install lxml)")
+    return parser
+
+
+def _squash(text: str) -> str:
+    return ' '.join(text.split())
+
+
+# --- BeautifulSoup ------------------------------------------------------------
+
+def _soup_content(html):
+    soup = BeautifulSoup(html, 'html.parser')
+    content_div = soup.find('div', {'id': CONTENT_ID})
+    if content_div is not None:
+        for tag in content_div.find_all(REMOVED_TAGS):
+            tag.decompose()
+    return soup, content_div
+
+
+def _article_bs4(html):
+    soup, content_div = _soup_content(html)
+    if content_div is None:
+        return "", []
+    heading = soup.find(id='firstHeading')
+    title = _squash(heading.get_text()) if heading else ""
+
+    for element in content_div.select(', '.join(f'.{name}' for name in NOISE_CLASSES)):
+        element.decompose()
+    blocks = []
+    for element in content_div.find_all(BLOCK_TAGS):
+        # A list item's text already includes its nested lists and paragraphs
+        if element.name not in HEADING_TAGS and element.find_parent(CONTAINER_TAGS) is not None:
+            continue
+        text = _squash(element.get_text())
+        if text:
+            blocks.append((element.name, text))
+    return title, blocks
+
+
+def _text_bs4(html):
+    _, content_div = _soup_content(html)
+    if content_div is None:
+        return ""
+    return content_div.get_text(separator='\n', strip=True)
+
+
+# --- lxml ---------------------------------------------------------------------
+
+_NOISE_XPATH = ' | '.join(
+    f".//*[contains(concat(' ', normalize-space(@class), ' '), ' {name} ')]" for name in NOISE_CLASSES
+)
+
+
+def _lxml_content(html):
+    if isinstance(html, bytes):
+        # Detect the encoding exactly as BeautifulSoup does (libxml2 would assume latin-1)
+        html = UnicodeDammit(html, is_html=True).unicode_markup
+    root = lxml.html.document_fromstring(html)
+    found = root.xpath(f'//div[@id="{CONTENT_ID}"]')
+    if not found:
+        return root, None
+    content = found[0]
+    for element in list(content.iter(*REMOVED_TAGS)):
+        _remove(element)
+    return root, content
+
+
+def _remove(element):
+    # Emptying the element in place keeps the text after it as a separate string,
+    # as decompose() does (drop_tree() would glue it onto the previous one)
+    element.clear(keep_tail=True)
+
+
+def _article_lxml(html):
+    root, content = _lxml_content(html)
+    if content is None:
+        return "", []
+    heading = root.xpath('//*[@id="firstHeading"]')
+    title = _squash(heading[0].text_content()) if heading else ""
+
+    for element in content.xpath(_NOISE_XPATH):
+        _remove(element)
+    blocks = []
+    for element in content.iter(*BLOCK_TAGS):
+        if element.tag not in HEADING_TAGS and any(a.tag in CONTAINER_TAGS for a in element.iterancestors()):
+            continue
+        text = _squash(element.text_content())
+        if text:
+            blocks.append((element.tag, text))
+    return title, blocks
+
+
+def _text_lxml(html):
+    _, content = _lxml_content(html)
+    if content is None:
+        return ""
+    strings = (s.strip() for s in content.xpath('.//text()'))
+    return '\n'.join(s for s in strings if s)
+
+
+# --- API ------------------------------------------------------------------------
+
+def extract_article(html, parser: str = 'auto'):
+    """(title, [(tag, text), ...]) of the headings, paragraphs and list items of an article."""
+    if resolve_parser(parser) == 'lxml':
+        return _article_lxml(html)
+    return _article_bs4(html)
+
+
+def extract_text(html, parser: str = 'auto') -> str:
+    """Article body text, one line per text node (the legacy split_text input)."""
+    if resolve_parser(parser) == 'lxml':
+        return _text_lxml(html)
+    return _text_bs4(html)
@@ -0,0 +1,105 @@
+# Local manifest for incremental, resumable ingestion
+import hashlib
+import json
+import logging
+import os
+from datetime import datetime
+
+
+def content_hash(text):
+    """Hash of a page's extracted text."""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def chunk_id(chunk):
+    """Deterministic document _id derived from the chunk content."""
+    return hashlib.sha256(chunk.encode('utf-8')).hexdigest()[:32]
+
+
+class IngestManifest:
+    """URL -> content hash -> chunk ids, persisted as JSON next to the ingestion script.
+
+    A page only gets its content hash recorded once every one of its chunks has
+    been inserted, so a page interrupted by a crash is picked up again on the
+    next run. Chunk ids are recorded as soon as they are inserted, so the
+    resumed run does not re-embed chunks that already made it into the collection.
+    """
+
+    VERSION = 1
+
+    def __init__(self, path):
+        self.path = path
+        self.pages = {}
+        self.inserted = set()
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.error(f"Could not read manifest {self.path}, starting fresh: {e}")
+            return
+        if data.get('version') != self.VERSION:
+            logging.warning(f"Manifest {self.path} has an unknown version, starting fresh.")
+            return
+        self.pages = data.get('pages', {})
+        self.inserted = set(data.get('inserted', []))
+        logging.info(f"Loaded manifest: {len(self.pages)} pages, {len(self.inserted)} chunks.")
+
+    def save(self):
+        """Atomically write the manifest (checkpoint)."""
+        data = {
+            'version': self.VERSION,
+            'pages': self.pages,
+            'inserted': sorted(self.inserted),
+        }
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def is_unchanged(self, url, page_hash):
+        page = self.pages.get(url)
+        return page is not None and page.get('content_hash') == page_hash
+
+    def plan_page(self, url, chunk_ids):
+        """Return (ids that still need inserting, ids of this page's old chunks no longer used).
+
+        The second list only says what the page dropped: another page of the
+        same run may still share those chunks, so pass them to stale_ids once
+        the run has finished instead of deleting them straight away.
+        """
+        new_ids = [cid for cid in chunk_ids if cid not in self.inserted]
+        old_ids = set(self.pages.get(url, {}).get('chunks', []))
+        referenced_elsewhere = set()
+        for other_url, page in self.pages.items():
+            if other_url != url:
+                referenced_elsewhere.update(page.get('chunks', []))
+        stale_ids = sorted(old_ids - set(chunk_ids) - referenced_elsewhere)
+        return new_ids, stale_ids
+
+    def stale_ids(self, candidates, keep=()):
+        """Of `candidates`, the ids no recorded page (nor `keep`, e.g. unfinished pages) references."""
+        referenced = set(keep)
+        for page in self.pages.values():
+            referenced.update(page.get('chunks', []))
+        return sorted(set(candidates) - referenced)
+
+    def is_inserted(self, cid):
+        return cid in self.inserted
+
+    def mark_inserted(self, ids):
+        self.inserted.update(ids)
+
+    def mark_deleted(self, ids):
+        self.inserted.difference_update(ids)
+
+    def complete_page(self, url, page_hash, chunk_ids):
+        self.pages[url] = {
+            'content_hash': page_hash,
+            'chunks': list(chunk_ids),
+            'completed_at': datetime.now().isoformat(),
+        }
@@ -0,0 +1,101 @@
+# Build a copy of the collection with a different embedding size
+#
+#   python migrate_dimensions.py --dimensions 512                 # truncate the stored vectors
+#   python migrate_dimensions.py --dimensions 512 --reembed       # embed every chunk again
+#   python migrate_dimensions.py --dimensions 768 --target phucgpt_768
+#
+# Truncating and re-normalizing a text-embedding-3 vector gives the same
+# result as requesting it with `dimensions`, so the default needs no OpenAI
+# calls. Re-embedding is for source vectors from another model. Documents keep
+# their _id, so the ingestion manifest stays valid for the new collection.
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+
+from data_ingestion import FootballDataIngestion
+
+# embeddings and rate_limiter live in the project root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from embeddings import reduce_dimensions  # noqa: E402
+from rate_limiter import BATCH  # noqa: E402
+
+
+async def migrate(ingestion, source_name, target_name, dimensions, reembed=False):
+    source = ingestion.db.get_collection(source_name)
+    ingestion.collection_name = target_name
+    ingestion.embedding_dimensions = dimensions
+    ingestion.create_collection()
+    target = ingestion.db.get_collection(target_name)
+
+    batch_size = ingestion.embed_batch_size if reembed else ingestion.insert_batch_size
+    projection = {'text': True, 'source': True, '$vector': True}
+    cursor = iter(source.find({}, projection=projection))
+    slots = asyncio.Semaphore(ingestion.insert_concurrency)
+    inserts = []
+    copied = skipped = 0
+    started = time.perf_counter()
+
+    async def insert(documents):
+        nonlocal copied
+        try:
+            await asyncio.to_thread(ingestion.insert_documents, target, documents)
+            copied += len(documents)
+        finally:
+            slots.release()
+
+    while batch := await asyncio.to_thread(lambda: [doc for _, doc in zip(range(batch_size), cursor)]):
+        if reembed:
+            usable = [doc for doc in batch if doc.get('text')]
+            skipped += len(batch) - len(usable)
+            batch = usable
+            texts = [doc['text'] for doc in batch]
+            vectors = await ingestion.limiter.call(
+                ingestion.embedding_model,
+                lambda: asyncio.to_thread(ingestion.embed_texts, texts),
+                tokens=sum(ingestion.estimate_tokens(text) for text in texts),
+                priority=BATCH
+            )
+        else:
+            usable = [doc for doc in batch if len(doc.get('$vector') or ()) >= dimensions]
+            skipped += len(batch) - len(usable)
+            batch = usable
+            vectors = reduce_dimensions([doc['$vector'] for doc in batch], dimensions).tolist() if batch else []
+        documents = [
+            {'_id': doc['_id'], '$vector': vector, 'text': doc.get('text', ''), 'source': doc.get('source', '')}
+            for doc, vector in zip(batch, vectors)
+        ]
+        if documents:
+            await slots.acquire()
+            inserts.append(asyncio.create_task(insert(documents)))
+    await asyncio.gather(*inserts)
+
+    logging.info(f"Migrated {copied} documents from '{source_name}' to '{target_name}' "
+                 f"({dimensions}-d, {'re-embedded' if reembed else 'truncated'}) in "
+                 f"{time.perf_counter() - started:.1f}s; skipped {skipped} without a usable vector or text.")
+    return copied, skipped
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Copy the collection into a new one with smaller vectors')
+    parser.add_argument('--dimensions', type=int, required=True, help='New vector size, e.g. 512 or 768')
+    parser.add_argument('--source', default=os.environ.get('ASTRA_DB_COLLECTION'))
+    parser.add_argument('--target', help='New collection (default: <source>_<dimensions>)')
+    parser.add_argument('--reembed', action='store_true', help='Embed the chunk texts again instead of truncating')
+    args = parser.parse_args()
+    target = args.target or f"{args.source}_{args.dimensions}"
+    if target == args.source:
+        parser.error('--target must differ from --source')
+
+    # Validate the size for the model before touching the database
+    os.environ['EMBEDDING_DIMENSIONS'] = str(args.dimensions)
+    ingestion = FootballDataIngestion()
+    asyncio.run(migrate(ingestion, args.source, target, args.dimensions, reembed=args.reembed))
+    logging.info(f"To switch, set ASTRA_DB_COLLECTION={target} and EMBEDDING_DIMENSIONS={args.dimensions} "
+                 f"for the web app and ingestion (and re-run `python vector_index.py sync` if RETRIEVAL_BACKEND=local).")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+# Local store of downloaded pages, for conditional re-fetching and offline ingestion
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+from datetime import datetime
+
+
+class PageNotStored(LookupError):
+    """Offline mode was asked for a page that has never been downloaded."""
+
+
+class PageStore:
+    """URL -> gzip-compressed response body plus its ETag / Last-Modified validators.
+
+    Each page is two files named after a hash of its URL: `<key>.html.gz` and a
+    `<key>.json` sidecar, both replaced atomically (body first), so fetch
+    threads never share a file and an interrupted run leaves either the old or
+    the new page. A body without its sidecar is simply re-downloaded.
+    """
+
+    def __init__(self, directory, compress_level=6):
+        self.directory = directory
+        self.compress_level = compress_level
+        self.downloaded = 0
+        self.not_modified = 0
+        self.served_offline = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, url, suffix):
+        key = hashlib.sha256(url.encode('utf-8')).hexdigest()[:32]
+        return os.path.join(self.directory, key + suffix)
+
+    def _write(self, path, data):
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def meta(self, url):
+        try:
+            with open(self._path(url, '.json'), encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logging.warning(f"Unreadable page store entry for {url}, ignoring it: {e}")
+            return None
+
+    def load(self, url):
+        """Stored body of `url`, or None."""
+        if self.meta(url) is None:
+            return None
+        try:
+            with gzip.open(self._path(url, '.html.gz'), 'rb') as f:
+                return f.read()
+        except (OSError, EOFError) as e:
+            logging.warning(f"Unreadable stored page for {url}, ignoring it: {e}")
+            return None
+
+    def conditional_headers(self, url):
+        """If-None-Match / If-Modified-Since for a revalidation request (empty if not stored)."""
+        meta = self.meta(url)
+        if meta is None or not os.path.exists(self._path(url, '.html.gz')):
+            return {}
+        headers = {}
+        if meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+        return headers
+
+    def save(self, url, body, headers):
+        self._write(self._path(url, '.html.gz'), gzip.compress(body, compresslevel=self.compress_level))
+        meta = {
+            'url': url,
+            'etag': headers.get('ETag'),
+            'last_modified': headers.get('Last-Modified'),
+            'size': len(body),
+            'fetched_at': datetime.now().isoformat(),
+        }
+        self._write(self._path(url, '.json'), json.dumps(meta, ensure_ascii=False).encode('utf-8'))
+
+    def fetch(self, session, url, offline=False, timeout=30):
+        """Body of `url`: revalidated against the stored copy, or only from the store when offline."""
+        if offline:
+            body = self.load(url)
+            if body is None:
+                raise PageNotStored(f"{url} is not in the page store ({self.directory})")
+            self._count('served_offline')
+            return body
+
+        response = session.get(url, headers=self.conditional_headers(url), timeout=timeout)
+        if response.status_code == 304:
+            body = self.load(url)
+            if body is not None:
+                self._count('not_modified')
+                return body
+            # The stored copy vanished between the request and now: download it again
+            response = session.get(url, timeout=timeout)
+        response.raise_for_status()
+        self.save(url, response.content, response.headers)
+        self._count('downloaded')
+        return response.content
+
+    def urls(self):
+        """URLs of every stored page."""
+        urls = []
+        for name in sorted(os.listdir(self.directory)):
+            if name.endswith('.json'):
+                try:
+                    with open(os.path.join(self.directory, name), encoding='utf-8') as f:
+                        urls.append(json.load(f)['url'])
+                except (OSError, ValueError, KeyError):
+                    continue
+        return urls
+
+    def report(self):
+        logging.info(
+            f"Page store {self.directory}: {self.downloaded} downloaded, "
+            f"{self.not_modified} not modified (304), {self.served_offline} served offline."
+        )
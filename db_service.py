@@ -1,28 +1,213 @@
 import os
 from dotenv import load_dotenv
-from pymongo import MongoClient
+from pymongo import MongoClient, ASCENDING, DESCENDING, ReturnDocument, monitoring
+from pymongo.errors import DuplicateKeyError
+from bson import ObjectId
 from datetime import datetime
+import atexit
+import base64
+import json
 import logging
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from cache_service import TTLCache
+from metrics import span
 
 
 load_dotenv()
 
-# Singleton pattern for the database client
-_mongo_client = None
-_db = None
+class PoolStatsListener(monitoring.ConnectionPoolListener):
+    """Counts connection pool events for capacity planning."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.open = 0
+        self.checked_out = 0
+        self.max_checked_out = 0
+        self.checkouts = 0
+        self.checkout_failures = 0
+        self.checkout_wait_seconds = 0.0
+        self.pool_clears = 0
+
+    def connection_created(self, event):
+        with self._lock:
+            self.open += 1
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.open -= 1
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            self.checked_out += 1
+            self.checkouts += 1
+            self.max_checked_out = max(self.max_checked_out, self.checked_out)
+            self.checkout_wait_seconds += getattr(event, 'duration', 0) or 0
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checked_out -= 1
+
+    def connection_check_out_failed(self, event):
+        # Includes wait-queue timeouts, i.e. the pool is too small for the load
+        with self._lock:
+            self.checkout_failures += 1
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self.pool_clears += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'open': self.open,
+                'checked_out': self.checked_out,
+                'max_checked_out': self.max_checked_out,
+                'checkouts': self.checkouts,
+                'checkout_failures': self.checkout_failures,
+                'checkout_wait_seconds': round(self.checkout_wait_seconds, 6),
+                'pool_clears': self.pool_clears,
+            }
+
+
+class MongoConnectionManager:
+    """Quản lý MongoClient cho từng process.
+
+    pymongo clients must not be shared across fork(), so the client is created
+    lazily in the process that uses it and recreated if the pid changes (e.g. a
+    client created in the gunicorn master is never used by a worker).
+    """
+
+    def __init__(self):
+        self._client = None
+        self._db = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self.pool_listener = PoolStatsListener()
+
+    # env var -> MongoClient option; unset variables keep the URI / pymongo defaults
+    ENV_OPTIONS = {
+        "MONGODB_MAX_POOL_SIZE": "maxPoolSize",
+        "MONGODB_MIN_POOL_SIZE": "minPoolSize",
+        "MONGODB_WAIT_QUEUE_TIMEOUT_MS": "waitQueueTimeoutMS",
+        "MONGODB_CONNECT_TIMEOUT_MS": "connectTimeoutMS",
+        "MONGODB_SERVER_SELECTION_TIMEOUT_MS": "serverSelectionTimeoutMS",
+        "MONGODB_MAX_IDLE_TIME_MS": "maxIdleTimeMS",
+    }
+
+    @classmethod
+    def client_options(cls) -> dict:
+        options = {
+            option: int(os.environ[env])
+            for env, option in cls.ENV_OPTIONS.items() if os.environ.get(env)
+        }
+        # e.g. "zstd,snappy,zlib" (zstd/snappy need the matching pymongo extras)
+        compressors = os.environ.get("MONGODB_COMPRESSORS")
+        if compressors:
+            options["compressors"] = compressors
+        return options
+
+    def get_db(self):
+        if self._db is not None and self._pid == os.getpid():
+            return self._db
+        with self._lock:
+            if self._db is None or self._pid != os.getpid():
+                mongo_uri = os.environ.get("MONGODB_URI")
+                if not mongo_uri:
+                    raise Exception("MONGODB_URI not set in environment variables.")
+                self.pool_listener.reset()
+                self._client = MongoClient(
+                    mongo_uri, event_listeners=[self.pool_listener], **self.client_options()
+                )
+                db_name = os.environ.get("MONGODB_DATABASE", "football_gpt_auth")
+                self._db = self._client[db_name]
+                self._pid = os.getpid()
+                logging.info(f"Connected to MongoDB database: {db_name} (pid {self._pid})")
+        return self._db
+
+    def warmup(self, connections: int = None):
+        """Open `connections` pooled connections up front so the first requests don't pay for the handshakes."""
+        if connections is None:
+            connections = int(os.environ.get("MONGODB_WARMUP_CONNECTIONS",
+                                             max(self.client_options().get("minPoolSize", 0), 4)))
+        db = self.get_db()
+        started = time.perf_counter()
+        db.command("ping")
+        if connections > 1:
+            # Concurrent operations each check out their own connection
+            with ThreadPoolExecutor(max_workers=connections) as pool:
+                list(pool.map(lambda _: db.command("ping"), range(connections)))
+        logging.info(f"MongoDB pool warmed with {self.pool_listener.open} connections "
+                     f"in {time.perf_counter() - started:.3f}s")
+
+    def pool_stats(self) -> dict:
+        stats = self.pool_listener.stats()
+        stats['max_pool_size'] = self._client.options.pool_options.max_pool_size if self._client else None
+        stats['pid'] = self._pid
+        return stats
+
+    def close(self):
+        with self._lock:
+            if self._client is not None and self._pid == os.getpid():
+                self._client.close()
+            self._client = None
+            self._db = None
+            self._pid = None
+
+
+mongo = MongoConnectionManager()
+
 
 def get_db():
     """Lấy kết nối đến database MongoDB."""
-    global _mongo_client, _db
-    if _db is None:
-        mongo_uri = os.environ.get("MONGODB_URI")
-        if not mongo_uri:
-            raise Exception("MONGODB_URI not set in environment variables.")
-        _mongo_client = MongoClient(mongo_uri)
-        db_name = os.environ.get("MONGODB_DATABASE", "football_gpt_auth")
-        _db = _mongo_client[db_name]
-        logging.info(f"Connected to MongoDB database: {db_name}")
-    return _db
+    return mongo.get_db()
+
+
+def init_worker():
+    """Chuẩn bị kết nối cho một worker trước khi nhận request: warmup pool và tạo index."""
+    try:
+        mongo.warmup()
+        ensure_indexes()
+    except Exception as e:
+        logging.error(f"MongoDB worker init failed: {e}")
+
+def ensure_indexes():
+    """Tạo các index cần thiết (idempotent), gọi một lần lúc khởi động."""
+    db = get_db()
+    # Serves both the per-user history query and its keyset pagination order
+    db.chat_histories.create_index(
+        [("user_id", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)],
+        name="user_id_created_at"
+    )
+    try:
+        db.users.create_index(
+            "email", unique=True, name="email_unique",
+            partialFilterExpression={"email": {"$type": "string"}}
+        )
+    except Exception as e:
+        # Existing duplicate emails must be cleaned up before the index can be built
+        logging.error(f"Could not create unique index on users.email: {e}")
+    logging.info("MongoDB indexes ensured.")
 
 # --- User Operations ---
 def find_user_by_id(user_id: str):
@@ -30,25 +215,6 @@ def find_user_by_id(user_id: str):
     db = get_db()
     return db.users.find_one({"_id": user_id})
 
-def save_user(user_claims: dict):
-    """Lưu hoặc cập nhật thông tin user."""
-    db = get_db()
-    user_data = {
-        "_id": user_claims['sub'],
-        "email": user_claims.get('email'),
-        "first_name": user_claims.get('first_name'),
-        "last_name": user_claims.get('last_name'),
-        "profile_image_url": user_claims.get('profile_image_url'),
-        "updated_at": datetime.now()
-    }
-    # Dùng upsert để tạo mới nếu chưa có, hoặc cập nhật nếu đã tồn tại
-    db.users.update_one(
-        {"_id": user_data["_id"]},
-        {"$set": user_data, "$setOnInsert": {"created_at": datetime.now()}},
-        upsert=True
-    )
-    return find_user_by_id(user_data["_id"])
-
 # --- OAuth Operations ---
 def find_oauth_token(user_id: str, browser_session_key: str, provider: str):
     """Tìm token OAuth."""
@@ -85,40 +251,295 @@ def delete_oauth_token(user_id: str, browser_session_key: str, provider: str):
     })
 
 # --- Chat History Operations ---
+class HistoryWriter:
+    """Write-behind buffer cho lịch sử chat.
+
+    Requests only enqueue the row; a background thread writes rows with
+    insert_many once `batch_size` rows are buffered or `flush_interval`
+    seconds have passed. The buffer is bounded: when Mongo falls behind,
+    enqueue blocks for up to `enqueue_timeout` seconds and then writes the
+    row synchronously, so a slow database slows requests down instead of
+    growing memory or dropping history.
+    """
+
+    def __init__(self, batch_size: int, flush_interval: float, max_pending: int, enqueue_timeout: float):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.enqueue_timeout = enqueue_timeout
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._stopping = False
+        self.written = 0
+        self.batches = 0
+        self.sync_fallbacks = 0
+        self.failed = 0
+
+    def _ensure_started(self):
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                # After a fork the parent's thread does not exist in this process
+                if self._pid is not None:
+                    self._queue = queue.Queue(maxsize=self._queue.maxsize)
+                self._stopping = False
+                self._thread = threading.Thread(target=self._run, name='history-writer', daemon=True)
+                self._thread.start()
+                self._pid = os.getpid()
+
+    def enqueue(self, document: dict):
+        self._ensure_started()
+        try:
+            self._queue.put(document, timeout=self.enqueue_timeout)
+        except queue.Full:
+            self.sync_fallbacks += 1
+            logging.warning("Chat history buffer full, writing synchronously")
+            get_db().chat_histories.insert_one(document)
+            self.written += 1
+
+    def _run(self):
+        while not (self._stopping and self._queue.empty()):
+            batch = []
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+                if self._stopping:
+                    deadline = 0
+            if batch:
+                self._write(batch)
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write(self, batch: list):
+        for attempt in range(3):
+            try:
+                with span('history_flush'):
+                    get_db().chat_histories.insert_many(batch, ordered=False)
+                self.written += len(batch)
+                self.batches += 1
+                return
+            except Exception as e:
+                logging.error(f"Chat history flush failed (attempt {attempt + 1}): {e}")
+                time.sleep(0.5 * 2 ** attempt)
+        self.failed += len(batch)
+        logging.error(f"Dropped {len(batch)} chat history rows after retries")
+
+    def flush(self):
+        """Block until everything enqueued so far has been written."""
+        if self._thread is not None and self._pid == os.getpid():
+            self._queue.join()
+
+    def close(self, timeout: float = 10):
+        """Flush remaining rows and stop the writer thread (called on shutdown)."""
+        if self._thread is None or self._pid != os.getpid():
+            return
+        self._stopping = True
+        self._thread.join(timeout)
+        self._thread = None
+
+    def stats(self) -> dict:
+        return {
+            'pending': self._queue.qsize(),
+            'written': self.written,
+            'batches': self.batches,
+            'sync_fallbacks': self.sync_fallbacks,
+            'failed': self.failed,
+        }
+
+
+history_writer = HistoryWriter(
+    batch_size=int(os.environ.get("CHAT_HISTORY_BATCH_SIZE", 100)),
+    flush_interval=float(os.environ.get("CHAT_HISTORY_FLUSH_INTERVAL", 1.0)),
+    max_pending=int(os.environ.get("CHAT_HISTORY_MAX_PENDING", 10000)),
+    enqueue_timeout=float(os.environ.get("CHAT_HISTORY_ENQUEUE_TIMEOUT", 0.5)),
+)
+atexit.register(history_writer.close)
+
+
+class CacheGeneration:
+    """Generation number of a per-worker cache, shared by all workers through MongoDB.
+
+    bump() is called by whichever worker receives an invalidation; every
+    worker polls the number from a background thread every `poll_interval`
+    seconds and calls `on_change` when it moves, so all of them drop their
+    cache within one interval without a database read on the request path.
+    """
+
+    def __init__(self, name: str, poll_interval: float):
+        self.name = name
+        self.poll_interval = poll_interval
+        self._generation = None
+        self._on_change = None
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self.changes = 0
+
+    def _read(self) -> int:
+        doc = get_db().cache_generations.find_one({"_id": self.name})
+        return doc.get("generation", 0) if doc else 0
+
+    def bump(self) -> int:
+        """Start a new generation; the other workers see it on their next poll."""
+        doc = get_db().cache_generations.find_one_and_update(
+            {"_id": self.name}, {"$inc": {"generation": 1}},
+            upsert=True, return_document=ReturnDocument.AFTER
+        )
+        # This worker invalidates directly, don't do it again on the next poll
+        self._generation = doc["generation"]
+        return self._generation
+
+    def watch(self, on_change):
+        """Start polling in this process (idempotent, restarted after a fork)."""
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._on_change = on_change
+                self._generation = None
+                self._thread = threading.Thread(
+                    target=self._run, name=f"cache-generation-{self.name}", daemon=True
+                )
+                self._thread.start()
+                self._pid = os.getpid()
+
+    def _run(self):
+        while True:
+            try:
+                generation = self._read()
+                if self._generation is not None and generation != self._generation:
+                    self.changes += 1
+                    self._on_change()
+                self._generation = generation
+            except Exception as e:
+                logging.warning(f"Cache generation '{self.name}' poll failed: {e}")
+            time.sleep(self.poll_interval)
+
+
+answer_cache_generation = CacheGeneration(
+    "answers", poll_interval=float(os.environ.get("ANSWER_CACHE_GENERATION_POLL", 5))
+)
+
+
 def save_chat_history(user_id: str, message: str, reply: str):
-    """Lưu một tin nhắn vào lịch sử chat."""
+    """Lưu một tin nhắn vào lịch sử chat (ghi trễ theo lô qua history_writer)."""
+    with span('save_chat_history'):
+        history_writer.enqueue({
+            "user_id": user_id,
+            "message": message,
+            "reply": reply,
+            "created_at": datetime.now()
+        })
+
+
+def save_chat_history_batch(user_id: str, items: list):
+    """Lưu nhiều cặp (message, reply) vào lịch sử chat (ghi trễ theo lô qua history_writer, giữ thứ tự)."""
+    created_at = datetime.now()
+    with span('save_chat_history'):
+        for message, reply in items:
+            history_writer.enqueue({
+                "user_id": user_id,
+                "message": message,
+                "reply": reply,
+                "created_at": created_at
+            })
+
+HISTORY_FIELDS = ("message", "reply", "created_at")
+_HISTORY_SORT = [("created_at", DESCENDING), ("_id", DESCENDING)]
+
+
+def _history_projection(fields):
+    # created_at is always fetched because the pagination cursor is built from it
+    return {field: 1 for field in set(fields) | {"created_at"}}
+
+
+def _serialize_history(h: dict, fields) -> dict:
+    # Chuyển đổi ObjectId thành string để JSON serialize
+    item = {"id": str(h["_id"])}
+    for field in fields:
+        value = h.get(field)
+        item[field] = value.isoformat() if isinstance(value, datetime) else value
+    return item
+
+
+def encode_history_cursor(h: dict) -> str:
+    raw = json.dumps([h["created_at"].isoformat(), str(h["_id"])])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_history_cursor(cursor: str):
+    """Trả về (created_at, ObjectId) từ cursor; ValueError nếu cursor không hợp lệ."""
+    try:
+        created_at, oid = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(created_at), ObjectId(oid)
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def get_chat_history_page(user_id: str, limit: int = 50, cursor: str = None, fields=HISTORY_FIELDS):
+    """Lấy một trang lịch sử chat (mới nhất trước) theo keyset pagination.
+
+    Returns (items, next_cursor); next_cursor is None on the last page.
+    """
     db = get_db()
-    db.chat_histories.insert_one({
-        "user_id": user_id,
-        "message": message,
-        "reply": reply,
-        "created_at": datetime.now()
-    })
+    query = {"user_id": user_id}
+    if cursor:
+        created_at, oid = decode_history_cursor(cursor)
+        query["$or"] = [
+            {"created_at": {"$lt": created_at}},
+            {"created_at": created_at, "_id": {"$lt": oid}},
+        ]
+    # Fetch one extra row to know whether there is a next page
+    histories = list(
+        db.chat_histories.find(query, _history_projection(fields)).sort(_HISTORY_SORT).limit(limit + 1)
+    )
+    next_cursor = encode_history_cursor(histories[limit - 1]) if len(histories) > limit else None
+    return [_serialize_history(h, fields) for h in histories[:limit]], next_cursor
+
 
 def get_chat_history(user_id: str, limit: int = 50):
     """Lấy lịch sử chat của một user."""
+    items, _ = get_chat_history_page(user_id, limit=limit)
+    return items
+
+
+def iter_chat_history(user_id: str, fields=HISTORY_FIELDS, batch_size: int = 500):
+    """Duyệt toàn bộ lịch sử chat của user theo từng batch từ server, không nạp hết vào bộ nhớ."""
     db = get_db()
     histories = db.chat_histories.find(
-        {"user_id": user_id}
-    ).sort("created_at", -1).limit(limit)
-    # Chuyển đổi ObjectId thành string để JSON serialize
-    return [
-        {
-            "id": str(h["_id"]),
-            "message": h["message"],
-            "reply": h["reply"],
-            "created_at": h["created_at"].isoformat()
-        } for h in histories
-    ]
+        {"user_id": user_id}, _history_projection(fields), batch_size=batch_size
+    ).sort(_HISTORY_SORT)
+    for h in histories:
+        yield _serialize_history(h, fields)
+
+USER_FIELDS = ("email", "first_name", "last_name", "profile_image_url")
+_USER_PROJECTION = {field: 1 for field in USER_FIELDS}
+
+# user_id -> User, so flask-login doesn't hit Mongo on every authenticated request.
+# Invalidation is per process; the TTL bounds staleness across workers.
+_user_cache = TTLCache(
+    maxsize=int(os.environ.get("USER_CACHE_SIZE", 10000)),
+    ttl=float(os.environ.get("USER_CACHE_TTL", 60))
+)
+
 
 class User:
     """Đây là class User để flask-login hoạt động với dữ liệu từ MongoDB."""
+    __slots__ = ("id",) + USER_FIELDS
+
     def __init__(self, user_dict):
-        self._dict = user_dict
-        for key, value in user_dict.items():
-            setattr(self, key, value)
         # Đảm bảo có thuộc tính 'id' cho flask-login
-        self.id = self._dict.get('_id')
+        self.id = user_dict.get('_id')
+        for field in USER_FIELDS:
+            setattr(self, field, user_dict.get(field))
 
     @property
     def is_authenticated(self):
@@ -135,30 +556,69 @@ class User:
     def get_id(self):
         return self.id
 
+
+def get_cached_user(user_id: str):
+    """Tải User theo ID, dùng cache TTL trước khi truy vấn MongoDB."""
+    user = _user_cache.get(user_id)
+    if user is not None:
+        return user
+    user_data = get_db().users.find_one({"_id": user_id}, _USER_PROJECTION)
+    if not user_data:
+        return None
+    user = User(user_data)
+    _user_cache.set(user_id, user)
+    return user
+
+
 # --- User Operations (thêm hàm mới) ---
 def find_user_by_email(email: str):
     """Tìm user theo email."""
     db = get_db()
-    user_data = db.users.find_one({"email": email})
+    user_data = db.users.find_one({"email": email}, _USER_PROJECTION)
     return User(user_data) if user_data else None
 
-# --- Cập nhật lại hàm save_user để trả về User object ---
+
 def save_user(user_claims: dict):
-    """Lưu hoặc cập nhật thông tin user và trả về User object."""
+    """Tạo user nếu chưa có (theo email) và trả về User object, trong một round trip.
+
+    An existing user keeps its profile and _id (e.g. someone who signed up with
+    GitHub and later logs in with Google under the same email); only the login
+    time is updated.
+    """
     db = get_db()
-    user_data = {
-        "_id": user_claims.get('sub') or str(user_claims.get('id')), # Dùng sub của Google hoặc id của GitHub
-        "email": user_claims.get('email'),
+    now = datetime.now()
+    user_id = user_claims.get('sub') or str(user_claims.get('id'))  # Dùng sub của Google hoặc id của GitHub
+    email = user_claims.get('email')
+    profile = {
+        "email": email,
         "first_name": user_claims.get('given_name') or user_claims.get('name'),
         "last_name": user_claims.get('family_name'),
         "profile_image_url": user_claims.get('picture') or user_claims.get('avatar_url'),
-        "updated_at": datetime.now()
     }
-    # Dùng upsert để tạo mới nếu chưa có, hoặc cập nhật nếu đã tồn tại
-    db.users.update_one(
-        {"_id": user_data["_id"]},
-        {"$set": user_data, "$setOnInsert": {"created_at": datetime.now()}},
-        upsert=True
-    )
-    # Trả về User object
-    return User(find_user_by_id(user_data["_id"]))
\ No newline at end of file
+    query = {"email": email} if email else {"_id": user_id}
+    update = {
+        "$set": {"last_login_at": now},
+        "$setOnInsert": {"_id": user_id, **profile, "created_at": now, "updated_at": now},
+    }
+    try:
+        user_data = db.users.find_one_and_update(
+            query, update, projection=_USER_PROJECTION, upsert=True, return_document=ReturnDocument.AFTER
+        )
+    except DuplicateKeyError:
+        # The insert clashed on _id: the user already exists under an older email
+        # (changed at the provider), so move it to the new one
+        user_data = db.users.find_one_and_update(
+            {"_id": user_id},
+            {"$set": {"email": email, "last_login_at": now, "updated_at": now}} if email
+            else {"$set": {"last_login_at": now}},
+            projection=_USER_PROJECTION, return_document=ReturnDocument.AFTER
+        )
+        if user_data is None:
+            # It clashed on email: two first logins with the same email raced and the
+            # other one inserted the user, so the retry matches that document
+            user_data = db.users.find_one_and_update(
+                query, update, projection=_USER_PROJECTION, upsert=True, return_document=ReturnDocument.AFTER
+            )
+    user = User(user_data)
+    _user_cache.set(user.id, user)
+    return user
@@ -0,0 +1,58 @@
+# Embedding model and dimensionality shared by the web app and the data scripts
+#
+# text-embedding-3 models return shortened vectors through the `dimensions`
+# parameter. A shortened embedding equals the first N components of the full
+# one, re-normalized, so existing 1536-d vectors can be reduced without
+# calling OpenAI again (see data/migrate_dimensions.py).
+import os
+
+EMBEDDING_MODEL = 'text-embedding-3-small'
+NATIVE_DIMENSIONS = {
+    'text-embedding-3-small': 1536,
+    'text-embedding-3-large': 3072,
+    'text-embedding-ada-002': 1536,
+}
+# Astra tunes its vector index for the embedding model that produced the vectors
+ASTRA_SOURCE_MODELS = {
+    'text-embedding-3-small': 'openai-v3-small',
+    'text-embedding-3-large': 'openai-v3-large',
+    'text-embedding-ada-002': 'ada002',
+}
+
+
+def embedding_dimensions(model: str = EMBEDDING_MODEL) -> int:
+    """EMBEDDING_DIMENSIONS, or the model's native size."""
+    native = NATIVE_DIMENSIONS[model]
+    dimensions = int(os.environ.get('EMBEDDING_DIMENSIONS', native))
+    if not 0 < dimensions <= native:
+        raise ValueError(f'EMBEDDING_DIMENSIONS must be between 1 and {native} for {model}, got {dimensions}')
+    if dimensions != native and model == 'text-embedding-ada-002':
+        raise ValueError('text-embedding-ada-002 does not support reduced dimensions')
+    return dimensions
+
+
+def request_options(dimensions: int, model: str = EMBEDDING_MODEL) -> dict:
+    """Extra embeddings.create() arguments; nothing at the native size, so requests stay unchanged."""
+    if dimensions == NATIVE_DIMENSIONS[model]:
+        return {}
+    return {'dimensions': dimensions}
+
+
+def collection_definition(dimensions: int, model: str = EMBEDDING_MODEL) -> dict:
+    """Astra collection definition for vectors of this size."""
+    return {
+        'vector': {
+            'dimension': dimensions,
+            'metric': 'cosine',
+            'sourceModel': ASTRA_SOURCE_MODELS.get(model, 'other'),
+        }
+    }
+
+
+def reduce_dimensions(vectors, dimensions: int):
+    """Truncate embeddings (one per row) to `dimensions` components and L2-normalize them again."""
+    import numpy as np  # only the data scripts need it; keeps the web app's import light
+    reduced = np.array(np.asarray(vectors, dtype=np.float32)[..., :dimensions])
+    norms = np.linalg.norm(reduced, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return reduced / norms
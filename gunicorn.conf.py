@@ -0,0 +1,53 @@
+# Gunicorn settings for the async serving mode.
+# Each worker runs one long-lived event loop (async_runtime) that multiplexes
+# all OpenAI/Astra calls; request threads only block waiting on it, so a
+# worker can hold as many in-flight chats as it has threads.
+import logging
+import os
+
+wsgi_app = "main:app"
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+worker_class = "gthread"
+workers = int(os.environ.get("GUNICORN_WORKERS", 2))
+threads = int(os.environ.get("GUNICORN_THREADS", 256))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 120))
+keepalive = 5
+
+
+def _prewarm():
+    from db_service import init_worker
+    from chat_service import get_chat_service
+    from async_runtime import runtime
+
+    init_worker()
+    runtime.get_loop()
+    try:
+        # Loading the tokenizer's BPE ranks takes a moment; don't pay it on the first chat
+        get_chat_service().context_builder.tokens.load()
+    except Exception as e:
+        logging.error(f"ChatService prewarm failed, it will be created on first request: {e}")
+
+
+def post_fork(server, worker):
+    # Everything is created in the worker (never in the master). PREWARM_MODE:
+    #   sync       - warm the MongoDB pool and build ChatService before accepting traffic
+    #   background - accept traffic immediately and warm up in a thread
+    #   off        - initialize lazily on the first request
+    metrics_port = os.environ.get("METRICS_PORT")
+    if metrics_port:
+        # One scrape target per worker: the first free port of METRICS_PORT .. METRICS_PORT+workers-1
+        from metrics import serve_worker_metrics
+        serve_worker_metrics(os.environ.get("METRICS_HOST", "127.0.0.1"), int(metrics_port), workers)
+
+    mode = os.environ.get("PREWARM_MODE", "sync")
+    if mode == "sync":
+        _prewarm()
+    elif mode == "background":
+        import threading
+        threading.Thread(target=_prewarm, name="prewarm", daemon=True).start()
+
+
+def worker_exit(server, worker):
+    # Flush buffered chat history before the worker goes away
+    from db_service import history_writer
+    history_writer.close()
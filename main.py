@@ -10,6 +10,8 @@ app.register_blueprint(github_bp, url_prefix="/login")
 app.register_blueprint(auth_bp, url_prefix="/auth")
 
 if __name__ == "__main__":
+    from db_service import init_worker
+    init_worker()
     app.run(host="0.0.0.0", port=3000, debug=True)
 
 logging.getLogger('pymongo').setLevel(logging.ERROR)
@@ -0,0 +1,233 @@
+# Lightweight in-process metrics exposed in the Prometheus text format
+#
+# Metrics are per worker process; Prometheus should scrape every worker (or
+# sum over them), as with any pre-fork server without a shared registry.
+# With METRICS_PORT set, each gunicorn worker serves its registry on its own
+# port (serve_worker_metrics) so every worker can be a scrape target.
+import bisect
+import contextvars
+import hmac
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Request ID of the HTTP request being served, propagated into the async runtime
+request_id_var = contextvars.ContextVar('request_id', default='-')
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def _format_labels(labelnames, values, extra=()) -> str:
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> list:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_format_labels(self.labelnames, key)} {value}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> list:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            snapshot = {key: list(series) for key, series in self._series.items()}
+        for key, series in sorted(snapshot.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, [('le', bound)])
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.labelnames, key, [('le', '+Inf')])
+            lines.append(f'{self.name}_bucket{labels} {series[-1]}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labelnames, key)} {series[-2]}')
+            lines.append(f'{self.name}_count{_format_labels(self.labelnames, key)} {series[-1]}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector):
+        """`collector()` returns exposition lines computed at scrape time (e.g. cache stats)."""
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            try:
+                lines.extend(collector())
+            except Exception as e:
+                logging.error(f'Metrics collector failed: {e}')
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    'footballgpt_stage_duration_seconds', 'Latency of each chat pipeline stage', ['stage']
+))
+STAGE_ERRORS = REGISTRY.register(Counter(
+    'footballgpt_stage_errors_total', 'Chat pipeline stages that raised', ['stage']
+))
+OPENAI_TOKENS = REGISTRY.register(Counter(
+    'footballgpt_openai_tokens_total', 'OpenAI tokens used', ['model', 'kind']
+))
+CONTEXT_TOKENS = REGISTRY.register(Counter(
+    'footballgpt_context_tokens_total',
+    'Prompt context tokens: raw (chunks joined verbatim) vs used (after merging, dedup and budget)',
+    ['kind']
+))
+HTTP_SECONDS = REGISTRY.register(Histogram(
+    'footballgpt_http_request_duration_seconds', 'HTTP request latency (until the response starts)',
+    ['endpoint', 'method', 'status']
+))
+
+
+@contextmanager
+def span(stage: str):
+    """Time a stage into STAGE_SECONDS (and STAGE_ERRORS if it raises)."""
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        STAGE_ERRORS.inc(stage=stage)
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        logging.debug(f'stage={stage} duration_ms={elapsed * 1000:.1f}')
+
+
+def record_usage(model: str, usage):
+    """Count prompt/completion tokens from an OpenAI `usage` object (may be None)."""
+    if usage is None:
+        return
+    prompt_tokens = getattr(usage, 'prompt_tokens', 0) or 0
+    completion_tokens = getattr(usage, 'completion_tokens', 0) or 0
+    if prompt_tokens:
+        OPENAI_TOKENS.inc(prompt_tokens, model=model, kind='prompt')
+    if completion_tokens:
+        OPENAI_TOKENS.inc(completion_tokens, model=model, kind='completion')
+
+
+def stats_collector(name: str, help_text: str, label: str, source):
+    """Expose a `{key: {stat: number}}` stats dict (e.g. cache_stats()) as gauges."""
+    def collect():
+        lines = [f'# HELP {name} {help_text}', f'# TYPE {name} gauge']
+        for key, stats in source().items():
+            for stat, value in stats.items():
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                lines.append(f'{name}{_format_labels((label, "stat"), (key, stat))} {value}')
+        return lines
+    return collect
+
+
+class RequestIdFilter(logging.Filter):
+    """Adds `request_id` to every log record."""
+
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        return True
+
+
+def install_log_request_ids():
+    for handler in logging.getLogger().handlers:
+        handler.addFilter(RequestIdFilter())
+
+
+def admin_authorized(headers) -> bool:
+    """ADMIN_TOKEN given as X-Admin-Token or as a bearer token (Prometheus `authorization`)."""
+    admin_token = os.environ.get('ADMIN_TOKEN')
+    provided = headers.get('X-Admin-Token') or ''
+    authorization = headers.get('Authorization') or ''
+    if not provided and authorization.startswith('Bearer '):
+        provided = authorization[len('Bearer '):].strip()
+    return bool(admin_token) and hmac.compare_digest(provided, admin_token)
+
+
+def serve_worker_metrics(host: str, first_port: int, ports: int):
+    """Serve this process's REGISTRY at /metrics on the first free port of [first_port, first_port + ports).
+
+    Runs in a daemon thread; returns the port, or None if all of them are taken.
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?', 1)[0] != '/metrics':
+                status, body = 404, b'Not found\n'
+            elif not admin_authorized(self.headers):
+                status, body = 403, b'Forbidden\n'
+            else:
+                status, body = 200, REGISTRY.render().encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    for port in range(first_port, first_port + ports):
+        try:
+            server = ThreadingHTTPServer((host, port), MetricsHandler)
+        except OSError:
+            continue
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+        logging.info(f'Worker metrics served on {host}:{port}/metrics')
+        return port
+    logging.error(f'No free metrics port in {first_port}-{first_port + ports - 1}')
+    return None
@@ -0,0 +1,364 @@
+# Admission control, rate limiting and retries for OpenAI calls
+#
+# One OpenAILimiter per process runs on that process's event loop. Limits are
+# per process: with several gunicorn workers, divide the account's limits
+# between them (and leave a share for ingestion, see INGEST_RATE_SHARE).
+import asyncio
+import bisect
+import itertools
+import logging
+import os
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+from cache_service import TTLCache
+from metrics import REGISTRY, Counter, Histogram
+
+INTERACTIVE = 0
+BATCH = 1
+_PRIORITY_NAMES = {INTERACTIVE: 'interactive', BATCH: 'batch'}
+
+WAIT_SECONDS = REGISTRY.register(Histogram(
+    'footballgpt_openai_limiter_wait_seconds', 'Time spent waiting for an OpenAI call slot', ['model', 'priority']
+))
+RETRIES = REGISTRY.register(Counter(
+    'footballgpt_openai_retries_total', 'OpenAI calls retried after a retryable error', ['model', 'status']
+))
+REJECTIONS = REGISTRY.register(Counter(
+    'footballgpt_rate_limit_rejections_total', 'Requests rejected by admission control', ['reason']
+))
+
+
+class LimitExceeded(Exception):
+    status_code = 429
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class UserRateLimited(LimitExceeded):
+    status_code = 429
+
+
+class Overloaded(LimitExceeded):
+    status_code = 503
+
+
+class TokenBucket:
+    """Refills at `rate_per_minute`, holding at most `capacity`. Not thread-safe on its own."""
+
+    def __init__(self, rate_per_minute: float, capacity: float):
+        self.rate = rate_per_minute / 60
+        self.capacity = max(capacity, 1)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, amount: float) -> float:
+        """Seconds until `amount` can be taken (0 if now)."""
+        now = time.monotonic()
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount: float):
+        """Take (or with a negative amount, give back) tokens; the level may go below zero."""
+        self._refill(time.monotonic())
+        self.level = min(self.capacity, self.level - amount)
+
+    def time_to_full(self) -> float:
+        """Seconds until the bucket is back at capacity if nothing more is taken."""
+        return (self.capacity - self.level) / self.rate if self.rate else 0.0
+
+
+class ModelBudget:
+    """Requests-per-minute and tokens-per-minute buckets of one model (0 = unlimited)."""
+
+    def __init__(self, rpm: float = 0, tpm: float = 0, burst_seconds: float = 10):
+        self.rpm, self.tpm = rpm, tpm
+        self.requests = TokenBucket(rpm, rpm * burst_seconds / 60) if rpm else None
+        self.tokens = TokenBucket(tpm, tpm * burst_seconds / 60) if tpm else None
+
+    def delay(self, tokens: int) -> float:
+        return max(self.requests.delay(1) if self.requests else 0.0,
+                   self.tokens.delay(tokens) if self.tokens else 0.0)
+
+    def take(self, tokens: int):
+        if self.requests:
+            self.requests.take(1)
+        if self.tokens:
+            self.tokens.take(tokens)
+
+    def correct(self, estimated: int, actual: int):
+        if self.tokens and actual is not None:
+            self.tokens.take(actual - estimated)
+
+
+class Permit:
+    """A granted call slot; release() it when the call (or stream) is over."""
+
+    def __init__(self, limiter, model: str, priority: int, tokens: int):
+        self._limiter = limiter
+        self.model = model
+        self.priority = priority
+        self.tokens = tokens
+        self._released = False
+
+    def record_usage(self, total_tokens: int):
+        """Replace the token estimate with the actual usage reported by OpenAI."""
+        budget = self._limiter.budgets.get(self.model)
+        if budget is not None and total_tokens is not None:
+            budget.correct(self.tokens, total_tokens)
+            self.tokens = total_tokens
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._limiter._release(self)
+
+
+class _Waiter:
+    __slots__ = ('priority', 'seq', 'model', 'tokens', 'future', 'enqueued')
+
+    def __init__(self, priority, seq, model, tokens, future):
+        self.priority, self.seq, self.model, self.tokens, self.future = priority, seq, model, tokens, future
+        self.enqueued = time.perf_counter()
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class OpenAILimiter:
+    """Shared gate in front of every OpenAI call of a process.
+
+    - at most `max_concurrency` calls in flight, of which at most
+      `batch_concurrency` may be BATCH priority (ingestion, bulk jobs);
+    - per-model RPM / TPM token buckets (see set_budget);
+    - waiting calls are granted in priority order, so interactive chat
+      overtakes queued batch work; a call that cannot be admitted within
+      `max_wait` seconds fails with Overloaded instead of queueing forever;
+    - retryable errors (429, 5xx, timeouts) are retried with full-jitter
+      exponential backoff, never sooner than Retry-After; a 429 also pauses
+      all calls to that model for that long, so callers back off together.
+
+    Must be used from a single event loop.
+    """
+
+    def __init__(self, max_concurrency: int = 256, batch_concurrency: int = None, max_wait: float = 30,
+                 max_attempts: int = 5, base_delay: float = 0.5, max_delay: float = 30):
+        self.max_concurrency = max_concurrency
+        self.batch_concurrency = max_concurrency // 2 if batch_concurrency is None else batch_concurrency
+        self.max_wait = max_wait
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budgets = {}
+        self._paused_until = {}
+        self._waiters = []
+        self._active = {INTERACTIVE: 0, BATCH: 0}
+        self._seq = itertools.count()
+        self._timer = None
+
+    def set_budget(self, model: str, rpm: float = 0, tpm: float = 0):
+        self.budgets[model] = ModelBudget(rpm, tpm)
+
+    def stats(self) -> dict:
+        return {
+            'in_flight': self._active[INTERACTIVE] + self._active[BATCH],
+            'in_flight_batch': self._active[BATCH],
+            'waiting': len(self._waiters),
+            'max_concurrency': self.max_concurrency,
+        }
+
+    async def acquire(self, model: str, tokens: int = 0, priority: int = INTERACTIVE) -> Permit:
+        waiter = _Waiter(priority, next(self._seq), model, tokens, asyncio.get_running_loop().create_future())
+        bisect.insort(self._waiters, waiter)
+        self._dispatch()
+        try:
+            permit = await asyncio.wait_for(waiter.future, self.max_wait)
+        except asyncio.TimeoutError:
+            REJECTIONS.inc(reason='overloaded')
+            raise Overloaded(f'No OpenAI capacity for {model} within {self.max_wait:.0f}s', retry_after=5)
+        except BaseException:
+            # Cancelled while a permit was being granted: hand the slot back
+            if waiter.future.done() and not waiter.future.cancelled():
+                waiter.future.result().release()
+            raise
+        finally:
+            if not waiter.future.done() or waiter.future.cancelled():
+                self._remove(waiter)
+        WAIT_SECONDS.observe(time.perf_counter() - waiter.enqueued,
+                             model=model, priority=_PRIORITY_NAMES[priority])
+        return permit
+
+    async def call(self, model: str, make_request, tokens: int = 0, priority: int = INTERACTIVE,
+                   hold: bool = False):
+        """Await make_request() under the limits, retrying retryable errors.
+
+        Returns the result, or (result, permit) with hold=True for streams that
+        keep using the slot until permit.release().
+        """
+        for attempt in itertools.count():
+            permit = await self.acquire(model, tokens, priority)
+            try:
+                result = await make_request()
+            except Exception as error:
+                permit.release()
+                delay, status = self._retry_delay(model, error, attempt)
+                if delay is None or attempt + 1 >= self.max_attempts:
+                    raise
+                RETRIES.inc(model=model, status=status)
+                logging.warning(f'OpenAI {model} call failed ({status}: {error}), retry {attempt + 1} in {delay:.1f}s')
+                await asyncio.sleep(delay)
+                continue
+            usage = getattr(result, 'usage', None)
+            permit.record_usage(getattr(usage, 'total_tokens', None))
+            if hold:
+                return result, permit
+            permit.release()
+            return result
+
+    def _retry_delay(self, model: str, error, attempt: int):
+        """(seconds to wait, status label), or (None, label) if the error is not retryable."""
+        status = getattr(error, 'status_code', None)
+        if status is None:
+            names = {cls.__name__ for cls in type(error).__mro__}
+            if not names & {'APIConnectionError', 'APITimeoutError', 'ConnectionError', 'TimeoutError'}:
+                return None, 'error'
+            status = 'connection'
+        elif not (status in (408, 409, 429) or status >= 500):
+            return None, str(status)
+
+        retry_after = _retry_after(error)
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.max_delay))
+        if status == 429:
+            self.pause(model, delay)
+        return delay, str(status)
+
+    def pause(self, model: str, seconds: float):
+        """Hold back every call to `model` for `seconds` (after a 429)."""
+        until = time.monotonic() + seconds
+        if until > self._paused_until.get(model, 0):
+            self._paused_until[model] = until
+            self._dispatch()
+
+    def _remove(self, waiter):
+        index = bisect.bisect_left(self._waiters, waiter)
+        if index < len(self._waiters) and self._waiters[index] is waiter:
+            del self._waiters[index]
+
+    def _release(self, permit: Permit):
+        self._active[permit.priority] -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        now = time.monotonic()
+        retry_in = None
+        blocked = set()  # models whose first waiter is out of budget: later waiters must not overtake it
+        remaining = []
+        for waiter in self._waiters:
+            if waiter.future.done():
+                continue
+            in_flight = self._active[INTERACTIVE] + self._active[BATCH]
+            if (in_flight >= self.max_concurrency or waiter.model in blocked
+                    or (waiter.priority == BATCH and self._active[BATCH] >= self.batch_concurrency)):
+                remaining.append(waiter)
+                continue
+            delay = self._paused_until.get(waiter.model, 0) - now
+            budget = self.budgets.get(waiter.model)
+            if budget is not None:
+                delay = max(delay, budget.delay(waiter.tokens))
+            if delay > 0:
+                blocked.add(waiter.model)
+                retry_in = delay if retry_in is None else min(retry_in, delay)
+                remaining.append(waiter)
+                continue
+            if budget is not None:
+                budget.take(waiter.tokens)
+            self._active[waiter.priority] += 1
+            waiter.future.set_result(Permit(self, waiter.model, waiter.priority, waiter.tokens))
+        self._waiters = remaining
+        if retry_in is not None:
+            self._timer = asyncio.get_running_loop().call_later(retry_in, self._dispatch)
+
+
+def _retry_after(error):
+    """Seconds from the Retry-After(-ms) headers of an API error, if any."""
+    headers = getattr(getattr(error, 'response', None), 'headers', None) or {}
+    try:
+        if headers.get('retry-after-ms'):
+            return float(headers['retry-after-ms']) / 1000
+        value = headers.get('retry-after')
+        if not value:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            return max(parsedate_to_datetime(value).timestamp() - time.time(), 0)
+    except (TypeError, ValueError):
+        return None
+
+
+def budget_from_env(prefix: str, share: float = 1.0) -> dict:
+    """rpm / tpm from <prefix>_RPM and <prefix>_TPM, scaled by `share` (0 = unlimited)."""
+    return {
+        'rpm': float(os.environ.get(f'{prefix}_RPM', 0)) * share,
+        'tpm': float(os.environ.get(f'{prefix}_TPM', 0)) * share,
+    }
+
+
+def build_openai_limiter(**overrides) -> OpenAILimiter:
+    options = dict(
+        max_concurrency=int(os.environ.get('OPENAI_MAX_CONCURRENCY', 256)),
+        batch_concurrency=int(os.environ['OPENAI_BATCH_MAX_CONCURRENCY'])
+        if os.environ.get('OPENAI_BATCH_MAX_CONCURRENCY') else None,
+        max_wait=float(os.environ.get('OPENAI_MAX_QUEUE_WAIT', 30)),
+        max_attempts=int(os.environ.get('OPENAI_MAX_ATTEMPTS', 5)),
+    )
+    options.update(overrides)
+    return OpenAILimiter(**options)
+
+
+class UserRateLimiter:
+    """Per-user token buckets for the chat endpoints (thread-safe, bounded)."""
+
+    def __init__(self, rate_per_minute: float, burst: float, maxsize: int = 100000):
+        self.rate_per_minute = rate_per_minute
+        self.burst = burst
+        # Each bucket expires when it would be full again (its TTL is renewed on every take),
+        # so forgetting it and starting a new, full one is exact
+        ttl = 60 * burst / rate_per_minute if rate_per_minute else 0
+        self._buckets = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+
+    def check(self, user_id: str, cost: float = 1):
+        """Take `cost` from the user's bucket or raise UserRateLimited."""
+        if not self.rate_per_minute:
+            return
+        with self._lock:
+            bucket = self._buckets.get(user_id) or TokenBucket(self.rate_per_minute, self.burst)
+            delay = bucket.delay(cost)
+            if delay > 0:
+                REJECTIONS.inc(reason='user')
+                raise UserRateLimited('Too many requests, please slow down', retry_after=delay)
+            bucket.take(cost)
+            # An overdrawn bucket (e.g. a large /api/chat/batch) stays for as long as its debt lasts
+            self._buckets.set(user_id, bucket, ttl=bucket.time_to_full())
+
+
+def build_user_rate_limiter() -> UserRateLimiter:
+    return UserRateLimiter(
+        rate_per_minute=float(os.environ.get('CHAT_USER_RATE_PER_MINUTE', 20)),
+        burst=float(os.environ.get('CHAT_USER_BURST', 5)),
+    )
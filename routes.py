@@ -1,15 +1,69 @@
-from flask import session, request, jsonify, render_template
-from app import app
+from flask import session, request, jsonify, render_template, Response, stream_with_context, g
+from app import app, SESSION_PREFIXES
 from flask_login import login_required, current_user
-from chat_service import chat_service
-from db_service import save_chat_history, get_chat_history, get_db
-import asyncio
+from chat_service import get_chat_service
+from db_service import (
+    save_chat_history, save_chat_history_batch, get_chat_history_page, iter_chat_history, HISTORY_FIELDS,
+    answer_cache_generation, history_writer, mongo
+)
+from async_runtime import run_async, iterate_async
+from rate_limiter import LimitExceeded, build_user_rate_limiter
+from static_assets import DEFAULT_STATIC_DIR, INDEX_FILE, HASHED_PREFIX, StaticAssets
+import chat_service
+import metrics
+import json
+import logging
+import math
+import os
+import time
+import uuid
 
 
 # Make session permanent
 @app.before_request
 def make_session_permanent():
-    session.permanent = True
+    if request.path.startswith(SESSION_PREFIXES):
+        session.permanent = True
+
+
+def _invalidate_local_answer_cache():
+    # Nothing to drop if this worker has not built its ChatService yet
+    service = chat_service._chat_service
+    if service is not None:
+        service.invalidate_answer_cache()
+
+
+# Follow invalidations received by any worker (the answer cache is per worker)
+@app.before_request
+def watch_answer_cache_generation():
+    answer_cache_generation.watch(_invalidate_local_answer_cache)
+
+
+# Request ID (client-supplied X-Request-ID or a new one) for logs and the response
+@app.before_request
+def start_request_metrics():
+    g.request_started = time.perf_counter()
+    g.request_id = request.headers.get('X-Request-ID', '')[:128] or uuid.uuid4().hex
+    metrics.request_id_var.set(g.request_id)
+
+
+@app.after_request
+def finish_request_metrics(response):
+    started = g.get('request_started')
+    if started is not None:
+        metrics.HTTP_SECONDS.observe(
+            time.perf_counter() - started,
+            endpoint=request.url_rule.rule if request.url_rule else 'unmatched',
+            method=request.method,
+            status=response.status_code,
+        )
+    if 'request_id' in g:
+        response.headers['X-Request-ID'] = g.request_id
+    return response
+
+# React build, indexed once per worker (precompressed variants, ETags, cache headers)
+static_assets = StaticAssets(os.environ.get('STATIC_ASSETS_DIR', DEFAULT_STATIC_DIR))
+
 
 # Serve React app for all frontend routes
 @app.route('/')
@@ -17,11 +71,27 @@ def make_session_permanent():
 def serve_react(path=''):
     if path.startswith('api/') or path.startswith('auth/'):
         return jsonify({'error': 'Not found'}), 404
-    
-    try:
-        return app.send_static_file('index.html')
-    except:
+
+    asset = static_assets.get(path)
+    if asset is None and not path.startswith(HASHED_PREFIX):
+        # Client-side routes (/chat, /login, ...) all load the app shell
+        asset = static_assets.get(INDEX_FILE)
+    if asset is None:
+        if path.startswith(HASHED_PREFIX):
+            return jsonify({'error': 'Not found'}), 404
         return jsonify({'error': 'Frontend not built. Run: cd client && npm run build'}), 500
+    return static_assets.response(asset)
+
+# Per-user request budget for the chat endpoints (CHAT_USER_RATE_PER_MINUTE / CHAT_USER_BURST)
+user_limiter = build_user_rate_limiter()
+
+
+def _limit_response(error: LimitExceeded):
+    response = jsonify({'error': str(error)})
+    response.status_code = error.status_code
+    response.headers['Retry-After'] = str(max(math.ceil(error.retry_after), 1))
+    return response
+
 
 # API: Get current user info
 @app.route('/api/user')
@@ -47,7 +117,8 @@ def chat():
         if not message:
             return jsonify({'error': 'Message is required'}), 400
         
-        reply = asyncio.run(chat_service.chat(message))
+        user_limiter.check(current_user.id)
+        reply = run_async(get_chat_service().chat(message))
         
         save_chat_history(
             user_id=current_user.id,
@@ -57,18 +128,236 @@ def chat():
         
         return jsonify({'reply': reply})
         
+    except LimitExceeded as error:
+        return _limit_response(error)
     except Exception as error:
-        print(f'Chat error: {str(error)}')
+        logging.exception(f'Chat error: {error}')
         return jsonify({'error': str(error)}), 500
 
 
-# API: Get chat history
+# Questions accepted by one /api/chat/batch request
+CHAT_BATCH_MAX_ITEMS = int(os.environ.get('CHAT_BATCH_MAX_ITEMS', 50))
+
+
+# API: Answer many questions in one request (internal tools: quizzes, FAQ preparation)
+@app.route('/api/chat/batch', methods=['POST'])
+@login_required
+def chat_batch():
+    data = request.get_json(silent=True) or {}
+    messages = data.get('messages')
+    if not isinstance(messages, list) or not messages:
+        return jsonify({'error': 'messages must be a non-empty list'}), 400
+    if len(messages) > CHAT_BATCH_MAX_ITEMS:
+        return jsonify({'error': f'At most {CHAT_BATCH_MAX_ITEMS} messages per batch'}), 400
+
+    # Each question counts against the user's budget
+    try:
+        user_limiter.check(current_user.id, cost=len(messages))
+    except LimitExceeded as error:
+        return _limit_response(error)
+
+    valid = [i for i, message in enumerate(messages) if isinstance(message, str) and message.strip()]
+    try:
+        replies = run_async(get_chat_service().chat_batch([messages[i] for i in valid])) if valid else []
+        outcomes = dict(zip(valid, replies))
+
+        results, answered = [], []
+        for i, message in enumerate(messages):
+            outcome = outcomes.get(i)
+            if i not in outcomes:
+                results.append({'index': i, 'error': 'Message is required'})
+            elif isinstance(outcome, Exception):
+                logging.error(f'Chat batch item {i} failed: {outcome}')
+                results.append({'index': i, 'error': str(outcome)})
+            else:
+                results.append({'index': i, 'reply': outcome})
+                answered.append((message, outcome))
+
+        save_chat_history_batch(current_user.id, answered)
+        return jsonify({
+            'results': results,
+            'succeeded': len(answered),
+            'failed': len(messages) - len(answered),
+        })
+
+    except LimitExceeded as error:
+        return _limit_response(error)
+    except Exception as error:
+        logging.exception(f'Chat batch error: {error}')
+        return jsonify({'error': str(error)}), 500
+
+
+def _sse(data: dict, event: str = None) -> str:
+    """Format one Server-Sent Events message."""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+# API: Chat endpoint streaming tokens as Server-Sent Events
+@app.route('/api/chat/stream', methods=['POST'])
+@login_required
+def chat_stream():
+    data = request.get_json()
+    message = data.get('message') if data else None
+    if not message:
+        return jsonify({'error': 'Message is required'}), 400
+
+    user_id = current_user.id
+    request_id = g.request_id
+    try:
+        user_limiter.check(user_id)
+    except LimitExceeded as error:
+        return _limit_response(error)
+
+    def generate():
+        # The body is produced after after_request; keep logging under this request's ID
+        metrics.request_id_var.set(request_id)
+        # Closing `tokens` (done, error or client disconnect) closes the upstream stream
+        tokens = iterate_async(get_chat_service().chat_stream(message))
+        parts = []
+        try:
+            for token in tokens:
+                parts.append(token)
+                yield _sse({'token': token})
+
+            reply = ''.join(parts)
+            save_chat_history(user_id=user_id, message=message, reply=reply)
+            yield _sse({'reply': reply}, event='done')
+        except Exception as error:
+            logging.exception(f'Chat stream error: {error}')
+            yield _sse({'error': str(error)}, event='error')
+        finally:
+            tokens.close()
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+def _history_fields():
+    """Parse ?fields=message,reply; None if it names an unknown field."""
+    raw = request.args.get('fields')
+    if not raw:
+        return HISTORY_FIELDS
+    fields = tuple(f.strip() for f in raw.split(',') if f.strip())
+    if not fields or any(f not in HISTORY_FIELDS for f in fields):
+        return None
+    return fields
+
+
+# API: Get chat history (newest first, keyset pagination)
+# Query params: limit, cursor (from the X-Next-Cursor header of the previous page), fields
 @app.route('/api/chat/history', methods=['GET'])
 @login_required
 def get_chat_history_route():
     try:
-        histories = get_chat_history(user_id=current_user.id, limit=50)
-        return jsonify(histories)
+        max_limit = int(os.environ.get('CHAT_HISTORY_MAX_PAGE_SIZE', 200))
+        limit = min(max(request.args.get('limit', 50, type=int), 1), max_limit)
+        fields = _history_fields()
+        if fields is None:
+            return jsonify({'error': f'fields must be a subset of {",".join(HISTORY_FIELDS)}'}), 400
+
+        try:
+            histories, next_cursor = get_chat_history_page(
+                user_id=current_user.id, limit=limit,
+                cursor=request.args.get('cursor'), fields=fields
+            )
+        except ValueError as error:
+            return jsonify({'error': str(error)}), 400
+
+        response = jsonify(histories)
+        if next_cursor:
+            response.headers['X-Next-Cursor'] = next_cursor
+        return response
         
     except Exception as error:
-        return jsonify({'error': str(error)}), 500
\ No newline at end of file
+        return jsonify({'error': str(error)}), 500
+
+
+# API: Export the user's full chat history as NDJSON (streamed)
+@app.route('/api/chat/history/export', methods=['GET'])
+@login_required
+def export_chat_history_route():
+    fields = _history_fields()
+    if fields is None:
+        return jsonify({'error': f'fields must be a subset of {",".join(HISTORY_FIELDS)}'}), 400
+
+    def generate(user_id):
+        for item in iter_chat_history(user_id, fields=fields):
+            yield json.dumps(item, ensure_ascii=False) + '\n'
+
+    return Response(
+        stream_with_context(generate(current_user.id)),
+        mimetype='application/x-ndjson',
+        headers={'Content-Disposition': 'attachment; filename="chat_history.ndjson"'}
+    )
+
+
+def _is_admin() -> bool:
+    return metrics.admin_authorized(request.headers)
+
+
+# API: Invalidate the semantic answer cache of every worker (called after re-ingestion)
+@app.route('/api/admin/cache/invalidate', methods=['POST'])
+def invalidate_cache_route():
+    if not _is_admin():
+        return jsonify({'error': 'Forbidden'}), 403
+
+    try:
+        generation = answer_cache_generation.bump()
+    except Exception as error:
+        logging.error(f'Answer cache generation bump failed: {error}')
+        return jsonify({'error': 'Could not reach the database, only this worker was invalidated'}), 503
+    finally:
+        _invalidate_local_answer_cache()
+    return jsonify({'status': 'ok', 'generation': generation})
+
+
+# API: Runtime stats of this worker (connection pool, caches, history buffer)
+@app.route('/api/admin/stats', methods=['GET'])
+def admin_stats_route():
+    if not _is_admin():
+        return jsonify({'error': 'Forbidden'}), 403
+
+    return jsonify({
+        'mongo_pool': mongo.pool_stats(),
+        'caches': get_chat_service().cache_stats(),
+        'chat_history_writer': history_writer.stats(),
+        'openai_limiter': get_chat_service().limiter_stats(),
+    })
+
+
+def _scrape_chat_caches() -> dict:
+    # Don't construct the ChatService just because Prometheus scraped us
+    service = chat_service._chat_service
+    return service.cache_stats() if service is not None else {}
+
+
+def _scrape_runtime() -> dict:
+    stats = {'mongo_pool': mongo.pool_stats(), 'chat_history_writer': history_writer.stats()}
+    service = chat_service._chat_service
+    if service is not None:
+        stats['openai_limiter'] = service.limiter_stats()
+    return stats
+
+
+metrics.REGISTRY.add_collector(metrics.stats_collector(
+    'footballgpt_cache', 'Chat cache counters and sizes', 'cache', _scrape_chat_caches
+))
+metrics.REGISTRY.add_collector(metrics.stats_collector(
+    'footballgpt_runtime', 'MongoDB pool, chat history writer and OpenAI limiter stats', 'component',
+    _scrape_runtime
+))
+
+
+# Prometheus metrics of the worker that happens to serve the request (stage latencies,
+# token usage, caches, pools). Scrape the per-worker METRICS_PORT endpoints instead
+# to get every worker; both need ADMIN_TOKEN.
+@app.route('/metrics', methods=['GET'])
+def metrics_route():
+    if not _is_admin():
+        return jsonify({'error': 'Forbidden'}), 403
+
+    return Response(metrics.REGISTRY.render(), mimetype='text/plain; version=0.0.4')
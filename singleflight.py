@@ -0,0 +1,74 @@
+# In-flight deduplication of identical async calls
+import asyncio
+import logging
+
+from metrics import REGISTRY, Counter
+
+COALESCED = REGISTRY.register(Counter(
+    'footballgpt_singleflight_calls_total',
+    'Calls that started an upstream computation (leader) or joined one in flight (follower)',
+    ['operation', 'role']
+))
+TIMEOUTS = REGISTRY.register(Counter(
+    'footballgpt_singleflight_timeouts_total', 'Waits on a shared computation that timed out', ['operation']
+))
+
+
+class _Flight:
+    __slots__ = ('task', 'waiters')
+
+    def __init__(self, task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key into one computation.
+
+    The first caller (leader) starts `factory()` as a task; callers arriving
+    while it runs (followers) await the same task. Everyone gets its result or
+    its exception. Each waiter gives up after `timeout` seconds; the shared
+    task is cancelled only once nobody is waiting for it any more. Nothing is
+    kept after the task finishes, so this never serves stale results.
+
+    Must be used from a single event loop (the worker's async runtime).
+    """
+
+    def __init__(self, operation: str, timeout: float = None):
+        self.operation = operation
+        self.timeout = timeout
+        self._flights = {}
+
+    def in_flight(self) -> int:
+        return len(self._flights)
+
+    async def do(self, key, factory):
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = self._flights[key] = _Flight(asyncio.ensure_future(factory()))
+            flight.task.add_done_callback(lambda task: self._forget(key, flight))
+            COALESCED.inc(operation=self.operation, role='leader')
+        else:
+            COALESCED.inc(operation=self.operation, role='follower')
+            logging.info(f'{self.operation}: joined an identical request in flight')
+
+        flight.waiters += 1
+        try:
+            # shield: a waiter timing out or being cancelled must not cancel the others' result
+            return await asyncio.wait_for(asyncio.shield(flight.task), self.timeout)
+        except asyncio.TimeoutError:
+            TIMEOUTS.inc(operation=self.operation)
+            raise
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                # Everyone gave up: stop the upstream work, and let the next caller start afresh
+                self._forget(key, flight)
+                flight.task.cancel()
+
+    def _forget(self, key, flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        # Retrieve the exception so an error nobody awaited is not reported as "never retrieved"
+        if flight.task.done() and not flight.task.cancelled():
+            flight.task.exception()
@@ -0,0 +1,94 @@
+# Serving the React build (client/dist) from an index built at startup
+#
+# Every file is read once when the worker starts: its bytes, its .br / .gz
+# variants (written by client/scripts/compress.mjs at build time), its
+# content type and an ETag. Requests are then answered from memory without
+# touching the filesystem:
+#   - the best variant the client accepts (br, then gzip, then identity)
+#   - Vite's content-hashed files under assets/ are cached for a year as immutable
+#   - index.html (and other unhashed files) must be revalidated: ETag / 304
+# A new build is picked up when the workers restart.
+import hashlib
+import logging
+import mimetypes
+import os
+from dataclasses import dataclass, field
+
+from flask import Response, request
+
+DEFAULT_STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'client', 'dist')
+INDEX_FILE = 'index.html'
+# Vite puts every content-hashed bundle here; their URLs change whenever their content does
+HASHED_PREFIX = 'assets/'
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'no-cache'
+# Preferred first; the suffix is what compress.mjs appends
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+@dataclass
+class Asset:
+    path: str
+    mimetype: str
+    cache_control: str
+    etag: str
+    # content encoding ('identity', 'br', 'gzip') -> bytes
+    bodies: dict = field(default_factory=dict)
+
+
+class StaticAssets:
+    def __init__(self, directory: str = DEFAULT_STATIC_DIR):
+        self.directory = directory
+        self.assets = {}
+        self.load()
+
+    def load(self):
+        """(Re)build the index from the files on disk."""
+        assets = {}
+        variants = tuple(suffix for _, suffix in ENCODINGS)
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if name.endswith(variants):
+                    continue
+                full_path = os.path.join(root, name)
+                path = os.path.relpath(full_path, self.directory).replace(os.sep, '/')
+                with open(full_path, 'rb') as f:
+                    body = f.read()
+                asset = Asset(
+                    path=path,
+                    mimetype=mimetypes.guess_type(name)[0] or 'application/octet-stream',
+                    cache_control=IMMUTABLE if path.startswith(HASHED_PREFIX) else REVALIDATE,
+                    etag=hashlib.sha256(body).hexdigest()[:20],
+                    bodies={'identity': body},
+                )
+                for encoding, suffix in ENCODINGS:
+                    if os.path.exists(full_path + suffix):
+                        with open(full_path + suffix, 'rb') as f:
+                            asset.bodies[encoding] = f.read()
+                assets[path] = asset
+        self.assets = assets
+        if INDEX_FILE not in assets:
+            logging.warning(f'Frontend not built: {self.directory}/{INDEX_FILE} is missing')
+        logging.info(f'Static assets indexed: {len(assets)} files, '
+                     f'{sum(len(a.bodies) > 1 for a in assets.values())} precompressed')
+
+    def get(self, path: str):
+        return self.assets.get(path)
+
+    def response(self, asset: Asset) -> Response:
+        """Response for the current request: best accepted encoding, caching headers, 304 when unchanged."""
+        encoding = 'identity'
+        for candidate, _ in ENCODINGS:
+            if candidate in asset.bodies and request.accept_encodings[candidate]:
+                encoding = candidate
+                break
+
+        response = Response(asset.bodies[encoding], mimetype=asset.mimetype)
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+        if len(asset.bodies) > 1:
+            response.vary.add('Accept-Encoding')
+        # Each encoding is a different representation, so it needs its own validator
+        response.set_etag(asset.etag if encoding == 'identity' else f'{asset.etag}-{encoding}')
+        response.headers['Cache-Control'] = asset.cache_control
+        return response.make_conditional(request)
@@ -0,0 +1,72 @@
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rate_limiter import UserRateLimited, UserRateLimiter  # noqa: E402
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    # TokenBucket and the TTLCache holding the buckets both read time.monotonic
+    monkeypatch.setattr(time, 'monotonic', clock)
+    return clock
+
+
+def admitted(limiter, user_id, cost=1):
+    try:
+        limiter.check(user_id, cost=cost)
+        return True
+    except UserRateLimited:
+        return False
+
+
+def test_sustained_requests_are_held_to_the_rate(clock):
+    limiter = UserRateLimiter(rate_per_minute=20, burst=5)
+    passed = 0
+    # One request per second for ten minutes: the burst, then 20 per minute
+    for _ in range(600):
+        passed += admitted(limiter, 'u1')
+        clock.now += 1
+    assert passed <= 5 + 20 * 10
+
+
+def test_overdrawn_bucket_is_not_forgotten(clock):
+    limiter = UserRateLimiter(rate_per_minute=20, burst=5)
+    # A 50-question batch overdraws the bucket by 45 tokens (135 s of refill)
+    assert admitted(limiter, 'u1', cost=50)
+    clock.now += 60
+    assert not admitted(limiter, 'u1')
+    clock.now += 80
+    assert admitted(limiter, 'u1')
+
+
+def test_idle_bucket_expires_full(clock):
+    limiter = UserRateLimiter(rate_per_minute=20, burst=5)
+    for _ in range(5):
+        assert admitted(limiter, 'u1')
+    assert not admitted(limiter, 'u1')
+    # Back to capacity after 15 s: a new full bucket is equivalent
+    clock.now += 15
+    for _ in range(5):
+        assert admitted(limiter, 'u1')
+    assert not admitted(limiter, 'u1')
+
+
+def test_users_have_separate_buckets(clock):
+    limiter = UserRateLimiter(rate_per_minute=20, burst=1)
+    assert admitted(limiter, 'u1')
+    assert not admitted(limiter, 'u1')
+    assert admitted(limiter, 'u2')
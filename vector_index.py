@@ -0,0 +1,228 @@
+# Local in-process replica of the Astra vector collection
+#
+# Snapshot layout (one directory per version, CURRENT points at the live one):
+#   <dir>/CURRENT
+#   <dir>/<version>/manifest.json   {"count", "dimension", "collection", "created_at"}
+#   <dir>/<version>/vectors.f32     float32 [count x dimension], L2-normalized
+#   <dir>/<version>/chunks.jsonl    {"text", "source"} per row, same order
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+DEFAULT_INDEX_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'vector_index')
+# int8 rows are dequantized and scored a cache-sized block at a time (~4 MB of float32),
+# which is far faster than converting the whole matrix and never copies it
+BLOCK_ELEMENTS = 1 << 20
+
+
+def _block_rows(vectors) -> int:
+    return max(1, BLOCK_ELEMENTS // max(vectors.shape[1], 1))
+
+
+def quantize_int8(vectors):
+    """Per-row symmetric int8 quantization. Returns (int8 matrix, float32 scale per row)."""
+    quantized = np.empty(vectors.shape, dtype=np.int8)
+    scales = np.empty(len(vectors), dtype=np.float32)
+    rows = _block_rows(vectors)
+    for start in range(0, len(vectors), rows):
+        block = np.asarray(vectors[start:start + rows], dtype=np.float32)
+        scale = np.abs(block).max(axis=1) / 127
+        scale[scale == 0] = 1.0
+        quantized[start:start + rows] = np.rint(block / scale[:, None])
+        scales[start:start + rows] = scale
+    return quantized, scales
+
+
+def int8_scores(quantized, scales, query):
+    """Dot products of a float32 query with int8 rows, dequantized block by block."""
+    scores = np.empty(len(quantized), dtype=np.float32)
+    rows = _block_rows(quantized)
+    for start in range(0, len(quantized), rows):
+        scores[start:start + rows] = quantized[start:start + rows].astype(np.float32) @ query
+    return scores * scales
+
+
+class LocalVectorIndex:
+    """Top-k cosine search over a memory-mapped snapshot of the collection.
+
+    With quantize='int8' the snapshot is held in memory as int8 (a quarter of
+    the float32 size) and scores are approximate.
+    """
+
+    def __init__(self, directory: str = DEFAULT_INDEX_DIR, refresh_interval: float = 60, quantize: str = None):
+        if quantize not in (None, 'int8'):
+            raise ValueError(f'Unsupported quantization {quantize!r} (expected int8)')
+        self.directory = directory
+        self.refresh_interval = refresh_interval
+        self.quantize = quantize
+        self.version = None
+        self.vectors = None
+        self.scales = None
+        self.chunks = []
+        self._checked_at = 0.0
+        # _lock guards the (vectors, scales, chunks, version) swap; _refresh_lock lets one
+        # thread load a new snapshot while the others keep searching the current one
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self.load()
+
+    @property
+    def available(self) -> bool:
+        return self.vectors is not None
+
+    @property
+    def dimension(self):
+        return None if self.vectors is None else self.vectors.shape[1]
+
+    def _current_version(self):
+        try:
+            with open(os.path.join(self.directory, 'CURRENT'), encoding='utf-8') as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def load(self):
+        """(Re)load the snapshot that CURRENT points at, if it changed."""
+        with self._refresh_lock:
+            self._load()
+
+    def _load(self):
+        version = self._current_version()
+        if version is None or version == self.version:
+            return
+        path = os.path.join(self.directory, version)
+        with open(os.path.join(path, 'manifest.json'), encoding='utf-8') as f:
+            manifest = json.load(f)
+        count, dimension = manifest['count'], manifest['dimension']
+        if count:
+            vectors = np.memmap(os.path.join(path, 'vectors.f32'), dtype=np.float32,
+                                mode='r', shape=(count, dimension))
+        else:
+            vectors = np.zeros((0, dimension), dtype=np.float32)
+        with open(os.path.join(path, 'chunks.jsonl'), encoding='utf-8') as f:
+            chunks = [json.loads(line) for line in f]
+        if len(chunks) != count:
+            raise ValueError(f'Snapshot {path} is inconsistent: {count} vectors, {len(chunks)} chunks')
+        scales = None
+        if self.quantize == 'int8':
+            vectors, scales = quantize_int8(vectors)
+        with self._lock:
+            self.vectors, self.scales, self.chunks, self.version = vectors, scales, chunks, version
+        logging.info(f'Local vector index loaded: version {version}, {count} x {dimension}'
+                     + (f' ({self.quantize})' if self.quantize else ''))
+
+    def maybe_refresh(self):
+        """Pick up a newer snapshot at most once every refresh_interval seconds."""
+        now = time.monotonic()
+        if now - self._checked_at < self.refresh_interval:
+            return
+        # Another request is already checking: search the current snapshot meanwhile
+        if not self._refresh_lock.acquire(blocking=False):
+            return
+        try:
+            self._checked_at = now
+            self._load()
+        except Exception as e:
+            logging.error(f'Local vector index refresh failed, keeping version {self.version}: {e}')
+        finally:
+            self._refresh_lock.release()
+
+    def search(self, query_vector, k: int = 3) -> list:
+        """Return the k most similar chunks as dicts with text, source and similarity."""
+        self.maybe_refresh()
+        with self._lock:
+            vectors, scales, chunks = self.vectors, self.scales, self.chunks
+        if vectors is None or not len(chunks):
+            return []
+        query = np.asarray(query_vector, dtype=np.float32)
+        # Not in place: asarray returns the caller's array when it is already float32
+        query = query / (np.linalg.norm(query) or 1.0)
+        scores = vectors @ query if scales is None else int8_scores(vectors, scales, query)
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [dict(chunks[i], similarity=float(scores[i])) for i in top]
+
+
+def write_snapshot(directory: str, documents, collection_name: str = '', keep: int = 2) -> str:
+    """Stream documents ({"text", "source", "$vector"}) into a new snapshot version and make it current."""
+    os.makedirs(directory, exist_ok=True)
+    version = datetime.now().strftime('%Y%m%d%H%M%S%f')
+    path = os.path.join(directory, version)
+    os.makedirs(path)
+
+    count, dimension = 0, None
+    with open(os.path.join(path, 'vectors.f32'), 'wb') as vf, \
+            open(os.path.join(path, 'chunks.jsonl'), 'w', encoding='utf-8') as cf:
+        for doc in documents:
+            vector = np.asarray(doc['$vector'], dtype=np.float32)
+            if dimension is None:
+                dimension = vector.shape[0]
+            elif vector.shape[0] != dimension:
+                logging.warning(f"Skipping document {doc.get('_id')}: dimension {vector.shape[0]} != {dimension}")
+                continue
+            vector /= (np.linalg.norm(vector) or 1.0)
+            vf.write(vector.tobytes())
+            cf.write(json.dumps({'text': doc.get('text', ''), 'source': doc.get('source', '')},
+                                ensure_ascii=False) + '\n')
+            count += 1
+
+    with open(os.path.join(path, 'manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump({
+            'count': count,
+            'dimension': dimension or 0,
+            'collection': collection_name,
+            'created_at': datetime.now().isoformat(),
+        }, f)
+
+    # Atomically switch readers to the new version, then drop old ones
+    tmp_current = os.path.join(directory, 'CURRENT.tmp')
+    with open(tmp_current, 'w', encoding='utf-8') as f:
+        f.write(version)
+    os.replace(tmp_current, os.path.join(directory, 'CURRENT'))
+
+    versions = sorted(d for d in os.listdir(directory) if os.path.isdir(os.path.join(directory, d)))
+    for old in versions[:-keep]:
+        shutil.rmtree(os.path.join(directory, old), ignore_errors=True)
+    logging.info(f'Snapshot {version} written: {count} chunks, dimension {dimension}')
+    return version
+
+
+def sync_from_astra(directory: str = DEFAULT_INDEX_DIR) -> str:
+    """Export the whole Astra collection into a new local snapshot."""
+    from astrapy import DataAPIClient
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    db = DataAPIClient().get_database(
+        os.environ.get('ASTRA_DB_ENDPOINT', ''),
+        token=os.environ.get('ASTRA_DB_APPLICATION_TOKEN', '')
+    )
+    collection_name = os.environ.get('ASTRA_DB_COLLECTION', 'phucgpt')
+    collection = db.get_collection(collection_name)
+    cursor = collection.find({}, projection={'text': True, 'source': True, '$vector': True})
+    return write_snapshot(directory, cursor, collection_name=collection_name)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description='Sync the local vector index from Astra DB')
+    parser.add_argument('command', choices=['sync'])
+    parser.add_argument('--dir', default=os.environ.get('LOCAL_INDEX_DIR', DEFAULT_INDEX_DIR))
+    parser.add_argument('--watch', type=float, default=0,
+                        help='Re-sync every N seconds instead of exiting after one sync')
+    args = parser.parse_args()
+
+    while True:
+        sync_from_astra(args.dir)
+        if not args.watch:
+            break
+        time.sleep(args.watch)